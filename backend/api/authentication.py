@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from recipes.models import User
+from recipes.versions import bump_version, get_version
+
+# Хэш пароля в кэш не попадает: при обращении Django дочитает его из БД.
+USER_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname != 'password'
+]
+
+
+class TokenCache:
+    """LRU-кэш ключ токена → данные пользователя со временем жизни."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._lock = Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (monotonic() + self.timeout, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT
+)
+
+
+def shared_key(key):
+    return f'api:token:{key}'
+
+
+def generation_key(key):
+    return f'api:token:generation:{key}'
+
+
+def get_generation(key):
+    """Поколение токена в общем кэше, без общего кэша — None."""
+    if not settings.TOKEN_CACHE_SHARED:
+        return None
+    return get_version(generation_key(key))
+
+
+def invalidate_tokens(keys):
+    def invalidate():
+        for key in keys:
+            token_cache.delete(key)
+        if settings.TOKEN_CACHE_SHARED:
+            for key in keys:
+                bump_version(generation_key(key))
+            cache.delete_many([shared_key(key) for key in keys])
+    # После коммита: иначе параллельный запрос успеет снова закэшировать
+    # ещё не удалённый токен.
+    transaction.on_commit(invalidate)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД для недавно виденных токенов.
+
+    Кэш процесса ограничен TOKEN_CACHE_SIZE и TOKEN_CACHE_TIMEOUT.
+    Записи сбрасываются при удалении токена и сохранении пользователя
+    (смена пароля, блокировка). Без TOKEN_CACHE_SHARED другие процессы
+    увидят это не позже чем через TOKEN_CACHE_TIMEOUT. С ним каждая
+    запись помнит поколение токена из общего кэша, и запись старого
+    поколения не принимается ни одним процессом.
+    """
+
+    def get_cached(self, key):
+        values = token_cache.get(key)
+        if values is None and settings.TOKEN_CACHE_SHARED:
+            values = cache.get(shared_key(key))
+            if values is not None:
+                token_cache.set(key, values)
+        if values is None:
+            return None
+        if values[0] != get_generation(key):
+            token_cache.delete(key)
+            return None
+        return values
+
+    def authenticate_credentials(self, key):
+        values = self.get_cached(key)
+        if values is None:
+            # Поколение читается до запроса к БД: если сброс случится
+            # между ними, запись получит старое поколение и не пройдёт
+            # проверку.
+            generation = get_generation(key)
+            user, token = super().authenticate_credentials(key)
+            values = (
+                generation,
+                token.created,
+                tuple(getattr(user, name) for name in USER_FIELDS)
+            )
+            token_cache.set(key, values)
+            if settings.TOKEN_CACHE_SHARED:
+                cache.set(
+                    shared_key(key), values, settings.TOKEN_CACHE_TIMEOUT
+                )
+            return user, token
+        # Каждый запрос получает свои объекты, чтобы изменения
+        # request.user не попадали в кэш.
+        _, created, user_values = values
+        user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, user_values)
+        token = Token(key=key, user=user, created=created)
+        token._state.adding = False
+        token._state.db = DEFAULT_DB_ALIAS
+        return user, token
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields == frozenset(['last_login']):
+        return
+    invalidate_tokens(list(
+        Token.objects.filter(user_id=instance.pk).values_list(
+            'key', flat=True
+        )
+    ))
@@ -0,0 +1,75 @@
+import bisect
+from threading import Lock
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+
+from recipes.catalog import ingredient_catalog
+from recipes.models import Ingredient
+
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+
+
+class IngredientPrefixIndex:
+    """Отсортированный по имени массив ингредиентов в памяти процесса.
+
+    Строится из справочника ingredient_catalog и перестраивается, когда
+    меняется его содержимое. Используется вместо индекса БД там, где нет
+    функциональных и триграммных индексов (SQLite).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._digest = None
+        self._keys = None
+        self._rows = None
+
+    def _load(self):
+        snapshot = ingredient_catalog.snapshot()
+        with self._lock:
+            if self._digest != snapshot.digest:
+                rows = sorted(
+                    snapshot.rows(),
+                    key=lambda row: (row['name'].lower(), row['id'])
+                )
+                self._rows = rows
+                self._keys = [row['name'].lower() for row in rows]
+                self._digest = snapshot.digest
+            return self._keys, self._rows
+
+    def search(self, query, limit):
+        keys, rows = self._load()
+        query = query.lower()
+        found = []
+        position = bisect.bisect_left(keys, query)
+        while (position < len(keys) and len(found) < limit
+               and keys[position].startswith(query)):
+            found.append(rows[position])
+            position += 1
+        if len(found) < limit:
+            for key, row in zip(keys, rows):
+                if query in key and not key.startswith(query):
+                    found.append(row)
+                    if len(found) == limit:
+                        break
+        return found
+
+
+prefix_index = IngredientPrefixIndex()
+
+
+def autocomplete_ingredients(query, limit):
+    """Ингредиенты, начинающиеся с query, затем содержащие его."""
+    if connection.vendor != 'postgresql':
+        return prefix_index.search(query, limit)
+    return list(
+        Ingredient.objects.filter(
+            name__icontains=query
+        ).annotate(
+            rank=Case(
+                When(name__istartswith=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('rank', 'name').values(*INGREDIENT_FIELDS)[:limit]
+    )
@@ -0,0 +1,126 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes import versions
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+from recipes.signals import bulk_changed
+
+# Какие закэшированные ответы устаревают при изменении модели.
+INVALIDATES = {
+    Recipe: ('recipes',),
+    RecipeIngredient: ('recipes',),
+    Recipe.tags.through: ('recipes',),
+    Tag: ('tags', 'recipes'),
+    Ingredient: ('ingredients', 'recipes'),
+    User: ('recipes', 'users'),
+}
+
+
+def version_key(namespace):
+    return f'api:version:{namespace}'
+
+
+def get_version(namespace):
+    """Версия пространства имён: время последнего изменения в мс."""
+    return versions.get_version(version_key(namespace))
+
+
+def bump_version(namespace):
+    # Старые ключи не удаляются: с новой версией они просто
+    # перестают читаться и вытесняются по таймауту.
+    versions.bump_version(version_key(namespace))
+
+
+class CachedResponseMixin:
+    """Кэширует list и retrieve с версионными ключами и ETag.
+
+    cache_namespace задаёт версию, которую сбрасывают сигналы моделей,
+    cache_anonymous_only отключает кэш для ответов, зависящих от
+    пользователя.
+    """
+    cache_namespace = None
+    cache_anonymous_only = False
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if self.cache_anonymous_only and request.user.is_authenticated:
+            return self.uncached_response(handler, request, *args, **kwargs)
+        version = get_version(self.cache_namespace)
+        digest = self.get_cache_digest(request)
+        etag = f'"{version}-{digest}"'
+        if self.is_not_modified(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f'api:{self.cache_namespace}:{version}:{digest}'
+            data = cache.get(key)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        response['ETag'] = etag
+        return response
+
+    def uncached_response(self, handler, request, *args, **kwargs):
+        """Ответ, зависящий от пользователя; вьюсет может добавить ETag."""
+        return handler(request, *args, **kwargs)
+
+    def get_cache_digest(self, request):
+        query = urlencode(sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        ))
+        return hashlib.md5(
+            f'{request.get_host()}{request.path}?{query}'.encode()
+        ).hexdigest()
+
+    def is_not_modified(self, request, etag):
+        # Только ETag: Last-Modified с точностью до секунды не отличает
+        # изменение в ту же секунду, что и прошлый ответ.
+        if_none_match = request.headers.get('If-None-Match')
+        return if_none_match is not None and etag in (
+            tag.strip() for tag in if_none_match.split(',')
+        )
+
+
+def bump_after_commit(sender):
+    # После коммита: иначе ответ по старым данным успеет закэшироваться
+    # под новой версией.
+    def bump():
+        for namespace in INVALIDATES.get(sender, ()):
+            bump_version(namespace)
+    if sender in INVALIDATES:
+        transaction.on_commit(bump)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(m2m_changed)
+def invalidate_cached_responses(sender, **kwargs):
+    if kwargs.get('update_fields') == frozenset(['last_login']):
+        return
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bump_after_commit(sender)
+
+
+@receiver(bulk_changed)
+def invalidate_after_bulk_change(sender, **kwargs):
+    bump_after_commit(sender)
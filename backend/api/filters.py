@@ -1,6 +1,12 @@
 from django_filters import rest_framework as filters
 
+from recipes.catalog import tag_catalog
 from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
+
+
+def tag_slug_choices():
+    return [(slug, slug) for slug in tag_catalog.snapshot().column('slug')]
 
 
 class RecipeFilter(filters.FilterSet):
@@ -12,7 +18,18 @@ class RecipeFilter(filters.FilterSet):
         field_name='is_in_shopping_cart',
         method='filter_is_in_shopping_cart'
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    # Допустимые значения берутся из справочника тегов в памяти,
+    # без запроса к БД на каждый запрос с фильтром.
+    tags = filters.MultipleChoiceFilter(
+        field_name='tags__slug',
+        choices=tag_slug_choices
+    )
+    # Стоит перед ordering: явная сортировка заменяет сортировку
+    # по релевантности.
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.OrderingFilter(
+        fields=('pub_date', 'favorites_count')
+    )
 
     class Meta:
         model = Recipe
@@ -30,6 +47,11 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(shopping_carts__user=user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(
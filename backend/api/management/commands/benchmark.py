@@ -0,0 +1,373 @@
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.metrics import RequestMetrics
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
+                            User)
+
+# Название, адрес и нужна ли авторизация.
+SCENARIOS = (
+    ('recipes_list_anonymous', '/api/recipes/', False),
+    ('recipes_list', '/api/recipes/', True),
+    ('recipes_list_page_10', '/api/recipes/?page=10', True),
+    ('recipes_list_cursor', '/api/recipes/?cursor=', True),
+    ('recipe_detail', '/api/recipes/{recipe_id}/', True),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3', True),
+    (
+        'download_shopping_cart',
+        '/api/recipes/download_shopping_cart/?format=txt',
+        True
+    ),
+    (
+        'download_shopping_cart_pdf',
+        '/api/recipes/download_shopping_cart/?format=pdf',
+        True
+    ),
+    ('shopping_list', '/api/recipes/shopping_list/', True),
+    # ?name=с: urllib не кодирует URL сам.
+    ('ingredients_autocomplete',
+     '/api/ingredients/autocomplete/?name=%D1%81', False),
+    ('tags', '/api/tags/', False),
+)
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеры времени ответа, количества SQL-запросов и памяти '
+            'для основных эндпоинтов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user',
+            help='Email пользователя, от имени которого идут запросы'
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            help='Запустить только указанные сценарии'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для результатов в формате JSON'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON предыдущего запуска для сравнения'
+        )
+        parser.add_argument(
+            '--url',
+            help='Адрес запущенного сервера вместо тестового клиента'
+        )
+        parser.add_argument(
+            '--gunicorn',
+            action='store_true',
+            help='Запустить локальный gunicorn и замерять через него'
+        )
+        parser.add_argument(
+            '--asgi',
+            action='store_true',
+            help='То же, что --gunicorn, но с ASGI-воркерами uvicorn'
+        )
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Сколько запросов сценария отправлять одновременно'
+        )
+        parser.add_argument(
+            '--mixed',
+            action='store_true',
+            help='Запускать все сценарии одновременно, а не по очереди'
+        )
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        token = Token.objects.get_or_create(user=user)[0].key
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        if recipe is None:
+            raise CommandError(
+                'Нет рецептов, сначала выполните команду seed_data'
+            )
+        scenarios = [
+            (name, path.format(recipe_id=recipe.id), authenticated)
+            for name, path, authenticated in SCENARIOS
+            if not options['scenario'] or name in options['scenario']
+        ]
+        server = None
+        base_url = options['url']
+        if options['gunicorn'] or options['asgi']:
+            server, base_url = self.start_gunicorn(
+                options['workers'], options['port'], options['asgi']
+            )
+        elif options['concurrency'] > 1 or options['mixed']:
+            raise CommandError(
+                '--concurrency и --mixed работают только с --url '
+                'или --gunicorn'
+            )
+
+        try:
+            results = self.run_scenarios(scenarios, token, base_url, options)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        report = {
+            'meta': {
+                'commit': get_commit(),
+                'created': datetime.now(timezone.utc).isoformat(),
+                'mode': 'http' if base_url else 'client',
+                'server': (
+                    'asgi' if options['asgi']
+                    else 'wsgi' if options['gunicorn'] else None
+                ),
+                'concurrency': options['concurrency'],
+                'mixed': options['mixed'],
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'user': user.email,
+                'dataset': {
+                    'users': User.objects.count(),
+                    'recipes': Recipe.objects.count(),
+                    'ingredients': Ingredient.objects.count(),
+                    'favorites': FavoriteRecipe.objects.count(),
+                    'shopping_carts': ShoppingCart.objects.count(),
+                },
+            },
+            'results': results,
+        }
+        if options['compare']:
+            self.compare(options['compare'], results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+    def run_scenarios(self, scenarios, token, base_url, options):
+        def run(scenario):
+            name, path, authenticated = scenario
+            headers = (
+                {'Authorization': f'Token {token}'}
+                if authenticated else {}
+            )
+            if base_url:
+                return self.run_http(base_url + path, headers, options)
+            return self.run_client(path, headers, options)
+
+        if options['mixed']:
+            # Медленные и быстрые запросы конкурируют за воркеры.
+            with ThreadPoolExecutor(len(scenarios)) as executor:
+                results = dict(zip(
+                    [name for name, _, _ in scenarios],
+                    executor.map(run, scenarios)
+                ))
+        else:
+            results = {scenario[0]: run(scenario) for scenario in scenarios}
+        for name, result in results.items():
+            self.report(name, result)
+        return results
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f'Пользователь {email} не найден')
+            return user
+        # По умолчанию самый «тяжёлый» пользователь по списку покупок.
+        user = User.objects.annotate(
+            carts=Count('shopping_carts')
+        ).order_by('-carts', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, сначала выполните команду seed_data'
+            )
+        return user
+
+    def run_client(self, path, headers, options):
+        client = Client(
+            **{f'HTTP_{name.upper()}': value
+               for name, value in headers.items()}
+        )
+        for _ in range(options['warmup']):
+            self.read(client.get(path))
+        timings = []
+        queries = []
+        total_started = time.perf_counter()
+        for _ in range(options['requests']):
+            metrics = RequestMetrics()
+            started = time.perf_counter()
+            with connection.execute_wrapper(metrics):
+                response = client.get(path)
+                size = len(self.read(response))
+            timings.append(time.perf_counter() - started)
+            queries.append(metrics.queries)
+        elapsed = time.perf_counter() - total_started
+        # tracemalloc замедляет выполнение, поэтому память
+        # замеряется отдельным запросом.
+        tracemalloc.start()
+        try:
+            self.read(client.get(path))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return self.summarize(
+            response.status_code, timings, queries, size, peak, elapsed
+        )
+
+    def run_http(self, url, headers, options):
+        request = Request(url, headers=headers)
+        for _ in range(options['warmup']):
+            self.fetch(request)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            samples = list(executor.map(
+                self.timed_fetch, [request] * options['requests']
+            ))
+        elapsed = time.perf_counter() - started
+        timings = [timing for _, timing, _, _ in samples]
+        queries = [count for _, _, count, _ in samples]
+        if None in queries:
+            queries = None
+        status, _, _, size = samples[-1]
+        return self.summarize(status, timings, queries, size, None, elapsed)
+
+    def timed_fetch(self, request):
+        started = time.perf_counter()
+        status, server_timing, body = self.fetch(request)
+        timing = time.perf_counter() - started
+        match = SERVER_TIMING_QUERIES.search(server_timing or '')
+        return (
+            status,
+            timing,
+            int(match.group(1)) if match else None,
+            len(body)
+        )
+
+    def read(self, response):
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def fetch(self, request):
+        try:
+            with urlopen(request) as response:
+                return (
+                    response.status,
+                    response.headers.get('Server-Timing'),
+                    response.read()
+                )
+        except HTTPError as error:
+            return error.code, error.headers.get('Server-Timing'), b''
+
+    def summarize(self, status, timings, queries, size, peak, elapsed):
+        return {
+            'status': status,
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+            'queries': max(queries) if queries else None,
+            'response_bytes': size,
+            'peak_memory_kb': None if peak is None else round(peak / 1024),
+        }
+
+    def report(self, name, result):
+        line = (
+            f'{name}: {result["status"]}, '
+            f'p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, '
+            f'{result["rps"]} запр./с, SQL-запросов {result["queries"]}'
+        )
+        if result['peak_memory_kb'] is not None:
+            line += f', память {result["peak_memory_kb"]} КБ'
+        self.stdout.write(line)
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)
+        self.stdout.write(
+            f'Сравнение с {previous["meta"].get("commit") or path}:'
+        )
+        for name, result in results.items():
+            before = previous['results'].get(name)
+            if before is None:
+                continue
+            changes = []
+            for field in ('p50_ms', 'p95_ms', 'rps', 'queries',
+                          'peak_memory_kb'):
+                if before.get(field) is None or result[field] is None:
+                    continue
+                changes.append(
+                    f'{field} {before[field]} → {result[field]}'
+                )
+            self.stdout.write(f'  {name}: {", ".join(changes)}')
+
+    def start_gunicorn(self, workers, port, asgi=False):
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            'foodgram.wsgi:application',
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers),
+        ]
+        if asgi:
+            command[3:4] = [
+                'foodgram.asgi:application',
+                '--worker-class', 'uvicorn.workers.UvicornWorker',
+            ]
+        server = subprocess.Popen(
+            command,
+            cwd=settings.BASE_DIR,
+            # Количество SQL-запросов читается из Server-Timing.
+            env={**os.environ, 'SERVER_TIMING': 'True'}
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn завершился при запуске')
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+            except OSError:
+                time.sleep(0.2)
+                continue
+            return server, f'http://127.0.0.1:{port}'
+        server.terminate()
+        raise CommandError('gunicorn не запустился за 30 секунд')
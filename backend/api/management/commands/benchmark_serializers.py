@@ -0,0 +1,141 @@
+import io
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import parsers, renderers
+from api.serializers import (FollowerRecipeSerializer, IngredientSerializer,
+                             RecipeSerializer, TagSerializer)
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, Recipe, Tag, User
+
+
+class Command(BaseCommand):
+    help = ('Сверка быстрого чтения сериализаторов с обычным '
+            'to_representation и замер скорости на 1000 объектов, '
+            'сравнение JSON на stdlib и orjson')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--user',
+            help='Email пользователя, от имени которого идут запросы'
+        )
+        parser.add_argument(
+            '--anonymous',
+            action='store_true',
+            help='Сериализовать для анонимного пользователя'
+        )
+
+    def handle(self, *args, **options):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = self.get_user(options)
+        view = RecipeViewSet(
+            request=request, action='list', format_kwarg=None
+        )
+        cases = (
+            (RecipeSerializer, view.get_queryset()[:options['recipes']]),
+            (
+                FollowerRecipeSerializer,
+                Recipe.objects.all()[:options['recipes']]
+            ),
+            (IngredientSerializer, Ingredient.objects.all()),
+            (TagSerializer, Tag.objects.all()),
+        )
+        for serializer_class, queryset in cases:
+            objects = list(queryset)
+            if not objects:
+                raise CommandError(
+                    'Нет данных, сначала выполните команду seed_data'
+                )
+            timings = {}
+            content = {}
+            for reference in (True, False):
+                timings[reference], data = self.measure(
+                    serializer_class, objects, request, reference,
+                    options['repeat']
+                )
+                content[reference] = JSONRenderer().render(data)
+            name = serializer_class.__name__
+            if content[True] != content[False]:
+                raise CommandError(f'{name}: ответы отличаются')
+            per_thousand = {
+                reference: timing / len(objects) * 1000 * 1000
+                for reference, timing in timings.items()
+            }
+            self.stdout.write(
+                f'{name} ({len(objects)} шт., {len(content[True])} байт): '
+                f'DRF {per_thousand[True]:.1f} мс, '
+                f'быстрый путь {per_thousand[False]:.1f} мс на 1000, '
+                f'ускорение {timings[True] / timings[False]:.1f}x'
+            )
+            self.compare_json(data, content[True], options['repeat'])
+        self.stdout.write(self.style.SUCCESS('Ответы совпадают побайтно'))
+
+    def get_user(self, options):
+        if options['anonymous']:
+            return AnonymousUser()
+        if options['user']:
+            user = User.objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+            return user
+        user = User.objects.annotate(
+            carts=Count('shopping_carts')
+        ).order_by('-carts', 'id').first()
+        return user or AnonymousUser()
+
+    def compare_json(self, data, content, repeat):
+        if renderers.orjson is None:
+            self.stdout.write('  orjson не установлен, сравнивать не с чем')
+            return
+        rendered = renderers.FastJSONRenderer().render(data)
+        if rendered != content:
+            raise CommandError('JSON на orjson отличается от stdlib')
+        parsed = parsers.FastJSONParser().parse(io.BytesIO(content))
+        if parsed != JSONParser().parse(io.BytesIO(content)):
+            raise CommandError('Разбор JSON на orjson отличается от stdlib')
+        timings = [
+            self.best_time(function, repeat) for function in (
+                lambda: JSONRenderer().render(data),
+                lambda: renderers.FastJSONRenderer().render(data),
+                lambda: JSONParser().parse(io.BytesIO(content)),
+                lambda: parsers.FastJSONParser().parse(io.BytesIO(content)),
+            )
+        ]
+        self.stdout.write(
+            f'  JSON: stdlib {timings[0] * 1000:.2f} мс, '
+            f'orjson {timings[1] * 1000:.2f} мс; '
+            f'разбор: stdlib {timings[2] * 1000:.2f} мс, '
+            f'orjson {timings[3] * 1000:.2f} мс'
+        )
+
+    def best_time(self, function, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def measure(self, serializer_class, objects, request, reference, repeat):
+        """Лучшее время сериализации из repeat попыток и данные."""
+        context = {
+            'request': request,
+            'reference_representation': reference,
+        }
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serializer_class(objects, many=True, context=context).data
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, data
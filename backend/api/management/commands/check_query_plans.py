@@ -0,0 +1,162 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe, RecipeIngredient, Tag, User
+
+# Запросы основных эндпоинтов, планы которых проверяются.
+PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?cursor=',
+    '/api/recipes/?is_favorited=1',
+    '/api/recipes/?is_in_shopping_cart=1',
+    '/api/recipes/?tags={tag}',
+    '/api/recipes/?author={author_id}',
+    '/api/recipes/?search={search}',
+    '/api/recipes/{recipe_id}/',
+    '/api/recipes/{recipe_id}/similar/',
+    '/api/recipes/what_to_cook/?ingredients={ingredients}',
+    '/api/recipes/feed/',
+    '/api/recipes/download_shopping_cart/',
+    '/api/recipes/shopping_list/',
+    '/api/users/subscriptions/?recipes_limit=3',
+    '/api/ingredients/?name={search}',
+)
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+class QueryCollector:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT') and not many:
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN для SQL-запросов основных эндпоинтов: ищет '
+            'последовательное чтение больших таблиц')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            default=1000,
+            help='Сколько строк в таблице считать большой таблицей'
+        )
+        parser.add_argument(
+            '--fail',
+            action='store_true',
+            help='Завершиться с ошибкой, если найдены проблемы'
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Печатать планы всех запросов'
+        )
+
+    def handle(self, *args, **options):
+        self.table_rows = {}
+        problems = 0
+        for path in self.get_paths():
+            collector = QueryCollector()
+            with connection.execute_wrapper(collector):
+                response = self.client.get(path)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.stdout.write(
+                f'{path}: {response.status_code}, '
+                f'запросов {len(collector.queries)}'
+            )
+            for sql, params in collector.queries:
+                plan, scans = self.explain(sql, params)
+                if options['verbose_plans']:
+                    self.stdout.write(plan)
+                for table, rows in scans:
+                    if rows < options['threshold']:
+                        continue
+                    problems += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'  Seq scan {table} (~{rows} строк): {sql[:200]}'
+                    ))
+        if problems and options['fail']:
+            raise CommandError(f'Найдено последовательных чтений: {problems}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Последовательных чтений больших таблиц: {problems}'
+        ))
+
+    def get_paths(self):
+        user = User.objects.annotate(
+            carts=Count('shopping_carts')
+        ).order_by('-carts', 'id').first()
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        tag = Tag.objects.first()
+        if user is None or recipe is None or tag is None:
+            raise CommandError(
+                'Нет данных, сначала выполните команду seed_data'
+            )
+        token = Token.objects.get_or_create(user=user)[0].key
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        ingredients = RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', flat=True)[:3]
+        values = {
+            'tag': tag.slug,
+            'author_id': recipe.author_id,
+            'recipe_id': recipe.id,
+            'search': recipe.name.split()[0][:3],
+            'ingredients': ','.join(map(str, ingredients)),
+        }
+        return [path.format(**values) for path in PATHS]
+
+    def explain(self, sql, params):
+        """Текст плана и список (таблица, строк) последовательных чтений."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0][0]['Plan']
+                return json.dumps(plan, indent=2), [
+                    (table, self.get_table_rows(table))
+                    for table in self.postgresql_scans(plan)
+                ]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            details = [row[-1] for row in cursor.fetchall()]
+        scans = []
+        tables = connection.introspection.table_names()
+        for detail in details:
+            match = SQLITE_SCAN.match(detail)
+            if match and match.group(1) in tables:
+                scans.append(
+                    (match.group(1), self.get_table_rows(match.group(1)))
+                )
+        return '\n'.join(details), scans
+
+    def postgresql_scans(self, node):
+        if node.get('Node Type') == 'Seq Scan':
+            yield node['Relation Name']
+        for child in node.get('Plans', ()):
+            yield from self.postgresql_scans(child)
+
+    def get_table_rows(self, table):
+        if table not in self.table_rows:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(
+                        'SELECT reltuples FROM pg_class WHERE relname = %s',
+                        [table]
+                    )
+                else:
+                    cursor.execute(
+                        'SELECT COUNT(*) FROM '
+                        f'{connection.ops.quote_name(table)}'
+                    )
+                row = cursor.fetchone()
+            self.table_rows[table] = int(row[0]) if row else 0
+        return self.table_rows[table]
@@ -0,0 +1,191 @@
+import logging
+from collections import defaultdict
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+METRICS = (
+    ('requests_total', 'counter', 'Количество запросов'),
+    ('request_seconds_sum', 'counter', 'Суммарное время ответа'),
+    ('db_queries_total', 'counter', 'Количество SQL-запросов'),
+    ('db_seconds_sum', 'counter', 'Суммарное время SQL-запросов'),
+    ('serialization_seconds_sum', 'counter', 'Суммарное время сериализации'),
+    ('response_bytes_total', 'counter', 'Суммарный размер ответов'),
+    ('query_budget_exceeded_total', 'counter', 'Превышения бюджета запросов'),
+)
+
+
+class QueryBudgetError(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += perf_counter() - started
+
+
+class MetricsRegistry:
+    """Накопленные метрики по эндпоинтам в памяти процесса."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._values = defaultdict(lambda: defaultdict(float))
+
+    def record(self, endpoint, **values):
+        with self._lock:
+            for name, value in values.items():
+                self._values[endpoint][name] += value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            values = {
+                endpoint: dict(metrics)
+                for endpoint, metrics in self._values.items()
+            }
+        lines = []
+        for name, kind, description in METRICS:
+            lines.append(f'# HELP foodgram_{name} {description}')
+            lines.append(f'# TYPE foodgram_{name} {kind}')
+            for endpoint in sorted(values):
+                lines.append(
+                    f'foodgram_{name}{{endpoint="{endpoint}"}} '
+                    f'{values[endpoint].get(name, 0):g}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def get_endpoint(view_func, request):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryMetricsMiddleware:
+    """Считает SQL-запросы и время для каждого запроса.
+
+    Копит их в registry, сверяет количество запросов с QUERY_BUDGETS
+    и при SERVER_TIMING отдаёт в заголовке Server-Timing.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics = RequestMetrics()
+        request.metrics_endpoint = None
+        started = perf_counter()
+        with connection.execute_wrapper(request.metrics):
+            response = self.get_response(request)
+        total = perf_counter() - started
+        endpoint = request.metrics_endpoint
+        if endpoint is None:
+            return response
+        metrics = request.metrics
+        size = 0 if response.streaming else len(response.content)
+        exceeded = self.check_budget(endpoint, metrics.queries)
+        registry.record(
+            endpoint,
+            requests_total=1,
+            request_seconds_sum=total,
+            db_queries_total=metrics.queries,
+            db_seconds_sum=metrics.db_time,
+            serialization_seconds_sum=metrics.serialization_time,
+            response_bytes_total=size,
+            query_budget_exceeded_total=int(exceeded),
+        )
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join((
+                f'db;dur={metrics.db_time * 1000:.1f};'
+                f'desc="{metrics.queries} queries"',
+                f'serialize;dur={metrics.serialization_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_endpoint = get_endpoint(view_func, request)
+
+    def check_budget(self, endpoint, queries):
+        budget = settings.QUERY_BUDGETS.get(endpoint)
+        if budget is None or queries <= budget:
+            return False
+        message = (
+            f'{endpoint}: {queries} SQL-запросов при бюджете {budget}'
+        )
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetError(message)
+        logger.warning(message)
+        return True
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        started = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            request = self.context.get('request')
+            metrics = getattr(request, 'metrics', None)
+            if metrics is not None:
+                metrics.serialization_time += perf_counter() - started
+
+
+TIMED_SERIALIZERS = {}
+
+
+def timed_serializer_class(serializer_class):
+    if serializer_class not in TIMED_SERIALIZERS:
+        TIMED_SERIALIZERS[serializer_class] = type(
+            serializer_class.__name__,
+            (TimedSerializerMixin, serializer_class),
+            {'__module__': serializer_class.__module__}
+        )
+    return TIMED_SERIALIZERS[serializer_class]
+
+
+class InstrumentedViewMixin:
+    """Засекает время сериализации для сериализаторов вьюсета."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = timed_serializer_class(
+            self.get_serializer_class()
+        )
+        kwargs.setdefault('context', self.get_serializer_context())
+        return serializer_class(*args, **kwargs)
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
@@ -1,6 +1,164 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """Приблизительное количество строк по статистике PostgreSQL.
+
+    На остальных СУБД, а также если статистика ещё не собрана,
+    выполняется обычный COUNT(*).
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            estimate = row[0] if row else 0
+        else:
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            estimate = cursor.fetchone()[0][0]['Plan']['Plan Rows']
+    if estimate <= 0:
+        return queryset.count()
+    return int(estimate)
+
+
+def cursor_datetime(value):
+    if not isinstance(value, str):
+        raise TypeError
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError
+    return parsed
+
+
+def cursor_int(value):
+    # bool — подкласс int, а числа за пределами bigint СУБД не примет.
+    if type(value) is not int:
+        raise TypeError
+    if not -2 ** 63 <= value < 2 ** 63:
+        raise ValueError
+    return value
+
+
+def cursor_str(value):
+    if not isinstance(value, str):
+        raise TypeError
+    if '\x00' in value:
+        raise ValueError
+    return value
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pub_date', '-id')
+    # Проверка и разбор значений курсора для каждого поля cursor_ordering.
+    cursor_parsers = (cursor_datetime, cursor_int)
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        queryset = queryset.order_by(*self.cursor_ordering)
+        # Общее количество считается только для первой страницы,
+        # дальше по курсору листаем без COUNT(*).
+        self.count = None if position else estimate_count(queryset)
+        if position:
+            queryset = queryset.filter(self.keyset_filter(position))
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], field.lstrip('-'))
+                for field in self.cursor_ordering
+            ]
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def keyset_filter(self, position):
+        conditions = []
+        for index, field in enumerate(self.cursor_ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(self.cursor_ordering[:index], position):
+                condition &= Q(**{previous.lstrip('-'): value})
+            conditions.append(condition)
+        return reduce(or_, conditions)
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode(
+            json.dumps(position, default=str).encode()
+        ).decode()
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.cursor_ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [
+                parse(value)
+                for parse, value in zip(self.cursor_parsers, position)
+            ]
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class SubscriptionPagination(LimitPageNumberPagination):
+    cursor_ordering = ('username', 'id')
+    cursor_parsers = (cursor_str, cursor_int)
+
+
+class RankedPagination(LimitPageNumberPagination):
+    # Сортировка по рассчитанной оценке не подходит для курсора по дате.
+    cursor_query_param = None
@@ -0,0 +1,146 @@
+import csv
+import io
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 18
+JSON_LINE_SEPARATORS = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson, если он установлен.
+
+    Вывод совпадает с JSONRenderer при компактном UTF-8 без отступов,
+    остальные случаи и типы, которых нет в orjson, обрабатывает DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact or self.get_indent(
+                    accepted_media_type, renderer_context or {}
+                )):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        )
+        # Как и DRF, экранируем разделители строк, недопустимые в JS.
+        for separator, escaped in JSON_LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый класс выгрузки списка покупок.
+
+    Вьюсет отдаёт список потоком через stream(), ошибки — в JSON.
+    render() собирает тот же поток целиком для обычного Response.
+    """
+    charset = 'utf-8'
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(self.stream(data))
+
+    @staticmethod
+    def format_ingredient(ingredient):
+        return (
+            f'{ingredient["ingredient__name"]} - {ingredient["sum_amount"]}'
+            f'{ingredient["ingredient__measurement_unit"]}'
+        )
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        separator = ''
+        for ingredient in ingredients:
+            yield f'{separator}{self.format_ingredient(ingredient)}'.encode(
+                self.charset
+            )
+            separator = '\n'
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Количество', 'Единица измерения')
+
+    def stream(self, ingredients):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.header)
+        for ingredient in ingredients:
+            writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['sum_amount'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+            yield buffer.getvalue().encode(self.charset)
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode(self.charset)
+
+
+class ShoppingCartPDFRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, ingredients):
+        # PDF собирается постранично из того же курсора, но в ответ
+        # уходит целиком: формат не допускает частичной отдачи.
+        if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT)
+            )
+        buffer = io.BytesIO()
+        document = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        top = height - PDF_MARGIN
+        y = top
+        document.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        for ingredient in ingredients:
+            if y < PDF_MARGIN:
+                document.showPage()
+                document.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+                y = top
+            document.drawString(
+                PDF_MARGIN, y, self.format_ingredient(ingredient)
+            )
+            y -= PDF_LINE_HEIGHT
+        document.save()
+        yield buffer.getvalue()
+
+
+SHOPPING_CART_RENDERERS = [ShoppingCartTextRenderer, ShoppingCartCSVRenderer]
+if canvas is not None:
+    SHOPPING_CART_RENDERERS.append(ShoppingCartPDFRenderer)
@@ -1,13 +1,60 @@
+from collections.abc import Mapping
+
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers, validators
 
+from recipes.catalog import ingredient_catalog, tag_catalog
 from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag, User)
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, User)
+from recipes.search import defer_ingredient_refresh, refresh_search
+from recipes.shopping_list import change_recipe
+
+
+class RecipeImageField(Base64ImageField):
+    """Отдаёт ссылку на уменьшенную копию картинки, если она готова.
+
+    Размер берётся из context['image_rendition'], иначе из rendition.
+    """
+
+    def __init__(self, rendition=None, **kwargs):
+        self.rendition = rendition
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        rendition = self.context.get('image_rendition', self.rendition)
+        name = value and value.instance.image_renditions.get(rendition)
+        if name:
+            value = FieldFile(value.instance, value.field, name)
+        return super().to_representation(value)
 
 
-class FollowerRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+class FastRepresentationMixin:
+    """Быстрое чтение: represent() собирает словарь без обхода полей DRF.
+
+    Результат совпадает с обычным to_representation, который остаётся
+    доступен через context['reference_representation'] для сверки
+    (команда benchmark_serializers). Словари, например строки .values(),
+    сериализуются обычным путём, как и экземпляры сериализаторов
+    без своего represent().
+    """
+
+    def to_representation(self, instance):
+        if (isinstance(instance, Mapping)
+                or self.context.get('reference_representation')):
+            return super().to_representation(instance)
+        return self.represent(instance)
+
+    def represent(self, instance):
+        return super().to_representation(instance)
+
+
+class FollowerRecipeSerializer(FastRepresentationMixin,
+                               serializers.ModelSerializer):
+    image = RecipeImageField(rendition='thumbnail')
 
     class Meta:
         model = Recipe
@@ -24,6 +71,14 @@ class FollowerRecipeSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def represent(self, recipe):
+        return {
+            'id': recipe.id,
+            'name': recipe.name,
+            'image': self.fields['image'].to_representation(recipe.image),
+            'cooking_time': recipe.cooking_time,
+        }
+
 
 class UserRegistrationSerializer(UserCreateSerializer):
     class Meta(UserCreateSerializer.Meta):
@@ -38,7 +93,8 @@ class UserRegistrationSerializer(UserCreateSerializer):
         ]
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(FastRepresentationMixin,
+                           serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     username = serializers.CharField(
         required=True,
@@ -58,42 +114,46 @@ class CustomUserSerializer(serializers.ModelSerializer):
             'is_subscribed',
         )
 
+    def represent(self, user):
+        return {
+            'email': user.email,
+            'id': user.id,
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'is_subscribed': self.get_is_subscribed(user),
+        }
+
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return obj.subscriptions.filter(
             username=self.context.get('request').user
         ).exists()
 
 
-class UserFollowSerializer(serializers.ModelSerializer):
-    is_subscribed = serializers.SerializerMethodField()
+class UserFollowSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField(read_only=True)
-    username = serializers.CharField(
-        required=True,
-        validators=[validators.UniqueValidator(
-            queryset=User.objects.all()
-        )]
-    )
 
-    class Meta:
-        model = User
-        fields = (
-            'email',
-            'id',
-            'username',
-            'first_name',
-            'last_name',
-            'is_subscribed',
+    class Meta(CustomUserSerializer.Meta):
+        fields = CustomUserSerializer.Meta.fields + (
             'recipes',
             'recipes_count'
         )
 
-    def get_is_subscribed(self, obj):
-        return obj.subscriptions.filter(
-            username=self.context.get('request').user
-        ).exists()
+    def represent(self, user):
+        data = super().represent(user)
+        data['recipes'] = self.get_recipes(user)
+        data['recipes_count'] = self.get_recipes_count(user)
+        return data
 
     def get_recipes(self, obj):
+        previews = self.context.get('recipes')
+        if previews is not None:
+            return FollowerRecipeSerializer(
+                previews.get(obj.id, []), many=True
+            ).data
         request = self.context.get('request')
         limit = request.GET.get('recipes_limit')
         queryset = Recipe.objects.filter(author=obj)
@@ -102,16 +162,25 @@ class UserFollowSerializer(serializers.ModelSerializer):
         return FollowerRecipeSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(FastRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
 
+    def represent(self, tag):
+        return {
+            'id': tag.id,
+            'name': tag.name,
+            'color': tag.color,
+            'slug': tag.slug,
+        }
 
-class IngredientSerializer(serializers.ModelSerializer):
+
+class IngredientSerializer(FastRepresentationMixin,
+                           serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = (
@@ -120,6 +189,13 @@ class IngredientSerializer(serializers.ModelSerializer):
             'measurement_unit',
         )
 
+    def represent(self, ingredient):
+        return {
+            'id': ingredient.id,
+            'name': ingredient.name,
+            'measurement_unit': ingredient.measurement_unit,
+        }
+
 
 class IngredientCreateSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(write_only=True)
@@ -130,7 +206,8 @@ class IngredientCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeIngredientSerializer(serializers.ModelSerializer):
+class RecipeIngredientSerializer(FastRepresentationMixin,
+                                 serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
@@ -146,10 +223,34 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
             'amount',
         )
 
+    def represent(self, recipe_ingredient):
+        ingredient = recipe_ingredient.ingredient
+        return {
+            'id': ingredient.id,
+            'name': ingredient.name,
+            'measurement_unit': ingredient.measurement_unit,
+            'amount': recipe_ingredient.amount,
+        }
+
+
+class CatalogTagField(serializers.PrimaryKeyRelatedField):
+    """Проверяет id тега по справочнику в памяти, без запроса к БД."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            tag = tag_catalog.snapshot().instance(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if tag is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tag
+
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     image = Base64ImageField(use_url=True, )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = CatalogTagField(
         queryset=Tag.objects.all(),
         many=True)
     cooking_time = serializers.IntegerField(max_value=1440, min_value=1)
@@ -169,38 +270,65 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
-    def validate(self, data):
-        ingredients = data.get('ingredients')
+    def to_internal_value(self, data):
+        # Ингредиенты проверяются раньше остальных полей, чтобы запрос
+        # с ошибкой в них не декодировал картинку из Base64.
+        if isinstance(data, Mapping) and 'ingredients' in data:
+            try:
+                ingredients = self.fields['ingredients'].run_validation(
+                    data['ingredients']
+                )
+            except serializers.ValidationError as exc:
+                raise serializers.ValidationError({
+                    'ingredients': exc.detail
+                })
+            self.check_ingredients(ingredients)
+        return super().to_internal_value(data)
+
+    def check_ingredients(self, ingredients):
+        # Ошибки в том же виде, что и из validate: списком сообщений.
         if not ingredients:
+            raise serializers.ValidationError({
+                'ingredients': ['Нужно выбрать хотя бы один ингредиент!']
+            })
+        ids = {ingredient['id'] for ingredient in ingredients}
+        if len(ids) != len(ingredients):
+            raise serializers.ValidationError({
+                'ingredients': ['Ингредиенты должны быть уникальными!']
+            })
+        if any(ingredient['amount'] <= 0 for ingredient in ingredients):
+            raise serializers.ValidationError({
+                'amount': ['Количество ингредиента должно быть больше нуля!']
+            })
+        snapshot = ingredient_catalog.snapshot()
+        missing = {pk for pk in ids if pk not in snapshot}
+        if missing:
+            # Ингредиент мог добавить другой процесс после загрузки снимка.
+            missing -= set(Ingredient.objects.filter(
+                id__in=missing
+            ).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError({
+                'ingredients': ['Нет ингредиентов с id: {}'.format(
+                    ', '.join(str(pk) for pk in sorted(missing))
+                )]
+            })
+
+    def validate(self, data):
+        if not data.get('ingredients'):
             raise serializers.ValidationError({
                 'ingredients': 'Нужно выбрать хотя бы один ингредиент!'
             })
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError({
-                    'ingredients': 'Ингредиенты должны быть уникальными!'
-                })
-            ingredients_list.append(ingredient_id)
-            amount = ingredient['amount']
-            if int(amount) <= 0:
-                raise serializers.ValidationError({
-                    'amount': 'Количество ингредиента должно быть больше нуля!'
-                })
 
         tags = data.get('tags')
         if not tags:
             raise serializers.ValidationError({
                 'tags': 'Нужно выбрать хотя бы один тэг!'
             })
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise serializers.ValidationError({
-                    'tags': 'Тэги должны быть уникальными!'
-                })
-            tags_list.append(tag)
+        if len({tag.pk for tag in tags}) != len(tags):
+            raise serializers.ValidationError({
+                'tags': 'Тэги должны быть уникальными!'
+            })
 
         cooking_time = data.get('cooking_time')
         if int(cooking_time) <= 0:
@@ -222,6 +350,43 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             ]
         )
 
+    def update_ingredients(self, ingredients, recipe):
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        to_delete = []
+        to_update = []
+        # Изменения для списков покупок: bulk_update и bulk_create
+        # не отправляют сигналы, удаление учитывается сигналом.
+        deltas = {}
+        for recipe_ingredient in recipe.recipe_ingredients.all():
+            amount = amounts.pop(recipe_ingredient.ingredient_id, None)
+            if amount is None:
+                to_delete.append(recipe_ingredient.pk)
+            elif recipe_ingredient.amount != amount:
+                deltas[recipe_ingredient.ingredient_id] = (
+                    amount - recipe_ingredient.amount
+                )
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if amounts:
+            self.create_ingredients(
+                [
+                    {'id': ingredient_id, 'amount': amount}
+                    for ingredient_id, amount in amounts.items()
+                ],
+                recipe
+            )
+            deltas.update(amounts)
+        if deltas:
+            change_recipe(recipe.pk, deltas)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -230,15 +395,20 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        # bulk_create не отправляет сигналы, а названия ингредиентов
+        # входят в поисковые данные рецепта.
+        refresh_search([recipe.pk])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         if validated_data.get('image') is not None:
             instance.image = validated_data.get('image')
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients(ingredients, instance)
+        # Поиск пересчитает сохранение рецепта, один раз на все строки.
+        with defer_ingredient_refresh(instance.pk):
+            self.update_ingredients(ingredients, instance)
         instance.tags.set(tags)
         return super().update(instance, validated_data)
 
@@ -249,7 +419,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ).data
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(FastRepresentationMixin, serializers.ModelSerializer):
+    image = RecipeImageField(rendition='card', read_only=True)
     tags = TagSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
@@ -275,19 +446,77 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def to_representation(self, recipe):
+        if hasattr(recipe, 'author_is_subscribed'):
+            recipe.author.is_subscribed = recipe.author_is_subscribed
+        return super().to_representation(recipe)
+
+    def represent(self, recipe):
+        fields = self.fields
+        tag = fields['tags'].child.represent
+        ingredient = fields['ingredients'].child.represent
+        return {
+            'id': recipe.id,
+            'tags': [tag(item) for item in recipe.tags.all()],
+            'author': fields['author'].represent(recipe.author),
+            'ingredients': [
+                ingredient(item) for item in recipe.recipe_ingredients.all()
+            ],
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            'name': recipe.name,
+            'image': fields['image'].to_representation(recipe.image),
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+        }
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         return (user.is_authenticated
                 and user.favorites.filter(recipe=obj).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         return (user.is_authenticated
                 and user.shopping_carts.filter(recipe=obj).exists())
 
 
+class RecipeCoverageSerializer(RecipeSerializer):
+    """Рецепт с долей имеющихся ингредиентов и списком недостающих."""
+    coverage = serializers.FloatField(read_only=True)
+    matched_count = serializers.IntegerField(read_only=True)
+    ingredients_count = serializers.IntegerField(read_only=True)
+    missing_ingredients = RecipeIngredientSerializer(
+        many=True,
+        read_only=True
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'coverage',
+            'matched_count',
+            'ingredients_count',
+            'missing_ingredients',
+        )
+
+    def represent(self, recipe):
+        data = super().represent(recipe)
+        ingredient = self.fields['missing_ingredients'].child.represent
+        data['coverage'] = float(recipe.coverage)
+        data['matched_count'] = int(recipe.matched_count)
+        data['ingredients_count'] = int(recipe.ingredients_count)
+        data['missing_ingredients'] = [
+            ingredient(item) for item in recipe.missing_ingredients
+        ]
+        return data
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = RecipeImageField(rendition='thumbnail')
 
     class Meta:
         model = Recipe
@@ -332,3 +561,29 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             'name',
             'image'
         )
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.ReadOnlyField(source='total_amount')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = (
+            'id',
+            'name',
+            'measurement_unit',
+            'amount',
+        )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
@@ -0,0 +1,580 @@
+import io
+import json
+import os
+import tempfile
+from base64 import urlsafe_b64encode
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils.http import http_date
+from rest_framework import serializers
+from rest_framework.generics import GenericAPIView
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from api.authentication import token_cache
+from api.cache import get_version
+from api.renderers import ShoppingCartCSVRenderer, ShoppingCartTextRenderer
+from api.serializers import (FastRepresentationMixin,
+                             FollowerRecipeSerializer, IngredientSerializer,
+                             TagSerializer)
+from recipes import interactions
+from recipes.counters import recount
+from recipes import search
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag, User)
+
+
+def create_recipes(author, count, tags, ingredients):
+    recipes = []
+    for index in range(count):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {index}',
+            text='Описание',
+            image='recipes/images/test.png',
+            cooking_time=index + 1
+        )
+        recipe.tags.set(tags)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        ])
+        recipes.append(recipe)
+    return recipes
+
+
+class QueryCountTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Иван', last_name='Иванов', password='Pa55word!'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                first_name='Пётр', last_name='Петров', password='Pa55word!'
+            )
+            for index in range(5)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', color='#FFFFFF',
+                               slug=f'tag{index}')
+            for index in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(3)
+        ]
+        for author in cls.authors:
+            create_recipes(author, 5, cls.tags, cls.ingredients)
+
+    def setUp(self):
+        cache.clear()
+
+
+class RecipeListQueriesTest(QueryCountTestCase):
+
+    def assert_constant_queries(self, expected):
+        for limit in (2, 20):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_constant_queries(4)
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_constant_queries(5)
+
+
+class SubscriptionsQueriesTest(QueryCountTestCase):
+
+    def assert_subscriptions(self, authors):
+        for author in authors:
+            author.subscriptions.add(self.user)
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 2}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), len(authors))
+        for item in response.data['results']:
+            newest = Recipe.objects.filter(author_id=item['id']).order_by(
+                '-pub_date', '-id'
+            ).values_list('id', flat=True)[:2]
+            self.assertEqual(
+                [recipe['id'] for recipe in item['recipes']], list(newest)
+            )
+            self.assertEqual(item['recipes_count'], 5)
+
+    def test_one_author(self):
+        self.assert_subscriptions(self.authors[:1])
+
+    def test_many_authors(self):
+        self.assert_subscriptions(self.authors)
+
+    def test_invalid_recipes_limit(self):
+        self.client.force_authenticate(self.user)
+        for limit in ('²', '-1', 'abc'):
+            with self.subTest(limit=limit):
+                response = self.client.get(
+                    '/api/users/subscriptions/', {'recipes_limit': limit}
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class FastRepresentationContractTest(QueryCountTestCase):
+    """Быстрое чтение сериализаторов совпадает с DRF побайтно."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipes = list(Recipe.objects.order_by('id'))
+        for recipe in recipes[::3]:
+            FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+        for recipe in recipes[1::4]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for recipe in recipes[::2]:
+            recipe.image_renditions = {
+                'card': 'recipes/renditions/card.webp',
+                'thumbnail': 'recipes/renditions/thumbnail.webp',
+            }
+            recipe.save(update_fields=['image_renditions'])
+        for author in cls.authors[:3]:
+            author.subscriptions.add(cls.user)
+        Ingredient.objects.create(
+            name='Соль "морская" \u2028', measurement_unit='г'
+        )
+
+    def get_reference(self, path, params=None):
+        """Ответ API, собранный обычным to_representation DRF."""
+        get_context = GenericAPIView.get_serializer_context
+
+        def reference_context(view):
+            context = get_context(view)
+            context['reference_representation'] = True
+            return context
+
+        cache.clear()
+        with mock.patch.object(
+            GenericAPIView, 'get_serializer_context', reference_context
+        ):
+            return self.client.get(path, params).content
+
+    def assert_same_response(self, path, params=None):
+        cache.clear()
+        fast = self.client.get(path, params)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, self.get_reference(path, params))
+
+    def assert_same_serializer(self, serializer_class, instances):
+        content = [
+            JSONRenderer().render(serializer_class(
+                instances,
+                many=True,
+                context={'reference_representation': reference}
+            ).data)
+            for reference in (True, False)
+        ]
+        self.assertEqual(content[0], content[1])
+
+    def test_recipes(self):
+        for user in (None, self.user):
+            self.client.force_authenticate(user)
+            with self.subTest(user=user):
+                self.assert_same_response('/api/recipes/', {'limit': 30})
+        recipe = Recipe.objects.first()
+        self.assert_same_response(f'/api/recipes/{recipe.id}/')
+
+    def test_recipes_coverage(self):
+        self.client.force_authenticate(self.user)
+        ingredient_ids = ','.join(
+            str(ingredient.id) for ingredient in self.ingredients[:2]
+        )
+        self.assert_same_response(
+            '/api/recipes/what_to_cook/', {'ingredients': ingredient_ids}
+        )
+
+    def test_subscriptions(self):
+        self.client.force_authenticate(self.user)
+        self.assert_same_response(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+
+    def test_follower_recipes(self):
+        self.assert_same_serializer(
+            FollowerRecipeSerializer, Recipe.objects.all()
+        )
+
+    def test_ingredients_and_tags(self):
+        self.assert_same_serializer(
+            IngredientSerializer, Ingredient.objects.all()
+        )
+        self.assert_same_serializer(TagSerializer, Tag.objects.all())
+
+    def test_serializer_without_represent(self):
+        class PlainTagSerializer(FastRepresentationMixin,
+                                 serializers.ModelSerializer):
+            class Meta(TagSerializer.Meta):
+                pass
+
+        self.assert_same_serializer(PlainTagSerializer, Tag.objects.all())
+
+
+class CursorPaginationTest(QueryCountTestCase):
+
+    def encode(self, position):
+        return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def test_next_page(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/recipes/', {'cursor': '', 'limit': 4})
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(next_page.status_code, 200)
+        self.assertEqual(len(next_page.data['results']), 4)
+        for author in self.authors:
+            author.subscriptions.add(self.user)
+        response = self.client.get(
+            '/api/users/subscriptions/', {'cursor': '', 'limit': 2}
+        )
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(next_page.status_code, 200)
+        self.assertEqual(
+            [item['username'] for item in next_page.data['results']],
+            ['author2', 'author3']
+        )
+
+    def test_tampered_cursor(self):
+        self.client.force_authenticate(self.user)
+        cursors = (
+            'not-base64!', self.encode({'a': 1}), self.encode([1]),
+            self.encode(['abc', 'x']), self.encode([1, 2]),
+            self.encode(['2022-13-40 10:00:00', 1]),
+            self.encode(['2022-01-01 10:00:00+00:00', True]),
+            self.encode(['2022-01-01 10:00:00+00:00', 2 ** 70]),
+        )
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/recipes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+        for cursor in (self.encode([1, 2]), self.encode(['a\u0000', 1])):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/api/users/subscriptions/', {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+class RecommendationsTest(QueryCountTestCase):
+
+    def test_feed_falls_back_to_popular_pages(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/recipes/feed/', {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], Recipe.objects.count())
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_similar_not_found(self):
+        for pk in ('abc', '²', '999999'):
+            with self.subTest(pk=pk):
+                response = self.client.get(f'/api/recipes/{pk}/similar/')
+                self.assertEqual(response.status_code, 404)
+
+    def test_similar_invalid_limit(self):
+        recipe = Recipe.objects.first()
+        for limit in ('²', '-1', 'abc'):
+            with self.subTest(limit=limit):
+                response = self.client.get(
+                    f'/api/recipes/{recipe.id}/similar/', {'limit': limit}
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_what_to_cook_invalid_ingredients(self):
+        self.client.force_authenticate(self.user)
+        for ingredients in ('1,²', '0', '-1', 'abc', ''):
+            with self.subTest(ingredients=ingredients):
+                response = self.client.get(
+                    '/api/recipes/what_to_cook/',
+                    {'ingredients': ingredients}
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class BulkInteractionsTest(QueryCountTestCase):
+
+    def test_concurrent_insert_is_not_counted_twice(self):
+        recipes = list(Recipe.objects.order_by('id')[:3])
+        insert = interactions.insert
+
+        def insert_after_other_request(model, user_id, recipe_ids):
+            # Другой запрос успел добавить рецепт после проверки.
+            model.objects.create(user_id=user_id, recipe_id=recipe_ids[0])
+            return insert(model, user_id, recipe_ids)
+
+        self.client.force_authenticate(self.user)
+        with mock.patch.object(
+            interactions, 'insert', insert_after_other_request
+        ):
+            response = self.client.post(
+                '/api/recipes/shopping_cart/',
+                {'recipes': [recipe.id for recipe in recipes]},
+                format='json'
+            )
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['exists', 'added', 'added']
+        )
+        self.assertEqual(
+            set(recount().values()), {0},
+            'счётчики разошлись с данными'
+        )
+        self.assertEqual(
+            {item['id']: item['amount'] for item in self.client.get(
+                '/api/recipes/shopping_list/'
+            ).data},
+            {ingredient.id: 3 for ingredient in self.ingredients}
+        )
+
+    def test_bulk_remove_and_clear(self):
+        recipes = [recipe.id for recipe in Recipe.objects.all()[:4]]
+        self.client.force_authenticate(self.user)
+        for path in ('/api/recipes/favorite/', '/api/recipes/shopping_cart/'):
+            self.client.post(path, {'recipes': recipes}, format='json')
+        response = self.client.delete(
+            '/api/recipes/favorite/', {'recipes': recipes[:2]}, format='json'
+        )
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['removed', 'removed']
+        )
+        self.client.delete('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(set(recount().values()), {0})
+        self.assertEqual(
+            self.client.get('/api/recipes/shopping_list/').data, []
+        )
+
+
+class CachedResponseTest(QueryCountTestCase):
+
+    def test_import_data_invalidates_cached_responses(self):
+        response = self.client.get('/api/ingredients/')
+        etag = response['ETag']
+        versions = {
+            namespace: get_version(namespace)
+            for namespace in ('ingredients', 'recipes')
+        }
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'ingredients.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump([{'name': 'шафран', 'measurement_unit': 'г'}], file)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_data', path, stdout=io.StringIO())
+        os.remove(path)
+        os.rmdir(directory)
+        for namespace, version in versions.items():
+            self.assertNotEqual(get_version(namespace), version)
+        response = self.client.get(
+            '/api/ingredients/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('шафран', [item['name'] for item in response.data])
+
+    def test_version_is_bumped_after_commit(self):
+        version = get_version('tags')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Новый', color='#000000', slug='new')
+            self.assertEqual(get_version('tags'), version)
+        self.assertNotEqual(get_version('tags'), version)
+
+    def test_change_in_the_same_second(self):
+        response = self.client.get('/api/tags/')
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Новый', color='#000000', slug='new')
+        response = self.client.get(
+            '/api/tags/',
+            HTTP_IF_NONE_MATCH=etag,
+            HTTP_IF_MODIFIED_SINCE=http_date()
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('new', [item['slug'] for item in response.data])
+        response = self.client.get(
+            '/api/tags/', HTTP_IF_MODIFIED_SINCE=http_date()
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class CountersTest(QueryCountTestCase):
+
+    def test_deleted_follower(self):
+        followed = self.authors[0]
+        followed.subscriptions.add(self.user)
+        followed.refresh_from_db()
+        self.assertEqual(followed.followers_count, 1)
+        self.user.delete()
+        followed.refresh_from_db()
+        self.assertEqual(followed.followers_count, 0)
+        self.assertEqual(recount()['User.followers_count'], 0)
+
+
+class DownloadShoppingCartTest(QueryCountTestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        recipe = Recipe.objects.first()
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_unknown_accept_falls_back_to_text(self):
+        self.client.force_authenticate(self.user)
+        for accept in ('application/json', 'image/png', '*/*'):
+            with self.subTest(accept=accept):
+                response = self.client.get(self.url, HTTP_ACCEPT=accept)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(
+                    response['Content-Type'].startswith('text/plain')
+                )
+                self.assertIn('ингредиент 0 - 1г', self.read(response))
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_render_matches_stream(self):
+        ingredients = [{
+            'ingredient__name': 'соль',
+            'ingredient__measurement_unit': 'г',
+            'sum_amount': 5,
+        }]
+        for renderer_class in (ShoppingCartTextRenderer,
+                               ShoppingCartCSVRenderer):
+            with self.subTest(renderer=renderer_class.__name__):
+                renderer = renderer_class()
+                self.assertEqual(
+                    renderer.render(ingredients),
+                    b''.join(renderer_class().stream(ingredients))
+                )
+
+    def test_errors_are_json(self):
+        for params in ({}, {'format': 'pdf'}, {'format': 'csv'}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(
+                    response['Content-Type'], 'application/json'
+                )
+                self.assertIn('detail', response.json())
+
+
+class ServerTimingTest(QueryCountTestCase):
+
+    def test_disabled_by_default(self):
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_enabled(self):
+        response = self.client.get('/api/recipes/')
+        self.assertIn('queries"', response['Server-Timing'])
+
+
+class SearchTest(QueryCountTestCase):
+
+    def test_patch_refreshes_search_once(self):
+        recipe = Recipe.objects.filter(author=self.authors[0]).first()
+        self.client.force_authenticate(self.authors[0])
+        with mock.patch.object(
+                search, 'refresh_search', wraps=search.refresh_search
+        ) as refresh_search:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {
+                    'name': 'Новое название',
+                    'text': 'Описание',
+                    'cooking_time': 5,
+                    'tags': [self.tags[0].id],
+                    'ingredients': [
+                        {'id': self.ingredients[0].id, 'amount': 2}
+                    ],
+                },
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        refresh_search.assert_called_once_with([recipe.id])
+
+    def test_index_is_reloaded_after_timeout(self):
+        recipe = Recipe.objects.first()
+        search.search_index.invalidate()
+        self.assertEqual(search.search_index.search('шакшука'), {})
+        # Как изменение из другого процесса: без сигналов.
+        Recipe.objects.filter(pk=recipe.pk).update(name='Шакшука')
+        self.assertEqual(search.search_index.search('шакшука'), {})
+        with override_settings(SEARCH_INDEX_TIMEOUT=0):
+            self.assertIn(
+                recipe.pk, search.search_index.search('шакшука')
+            )
+
+
+@override_settings(TOKEN_CACHE_SHARED=True)
+class TokenCacheTest(QueryCountTestCase):
+    url = '/api/users/me/'
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        response = self.client.post('/api/auth/token/login/', {
+            'email': 'reader@example.com', 'password': 'Pa55word!'
+        })
+        self.key = response.data['auth_token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.stale = token_cache.get(self.key)
+
+    def get_from_other_process(self):
+        """Запрос процесса, в чьём локальном кэше осталась старая запись."""
+        token_cache.set(self.key, self.stale)
+        return self.client.get(self.url)
+
+    def test_password_hash_is_not_cached(self):
+        self.assertNotIn(self.user.password, self.stale[2])
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_from_other_process().status_code, 401)
+
+    def test_set_password(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('N3wPa55word!')
+            self.user.save()
+        self.assertEqual(self.get_from_other_process().status_code, 200)
+        self.assertNotEqual(token_cache.get(self.key), self.stale)
+
+    def test_inactive_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.get_from_other_process().status_code, 401)
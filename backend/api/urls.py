@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .metrics import MetricsView
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
 
 router = DefaultRouter()
@@ -13,6 +14,7 @@ subscriptions = UserViewSet.as_view({'get': 'subscriptions', })
 
 urlpatterns = [
     path('users/subscriptions/', subscriptions, name='subscriptions'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include('djoser.urls'), name='djoser'),
     path('auth/', include('djoser.urls.authtoken'), name='djoser-authtoken'),
     path('', include(router.urls), name='api')
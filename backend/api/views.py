@@ -1,22 +1,91 @@
-from django.db.models import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
+import hashlib
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import (Count, Exists, F, FloatField, OuterRef,
+                              Prefetch, Q, Sum, Value, Window)
+from django.db.models.functions import Cast, RowNumber
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets, filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated, SAFE_METHODS
 from rest_framework.response import Response
 
+from recipes.catalog import ingredient_catalog, tag_catalog
+from recipes import interactions
 from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag, User)
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            SimilarRecipe, Tag, User)
+
+from .autocomplete import autocomplete_ingredients
+from .cache import CachedResponseMixin, get_version
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import LimitPageNumberPagination
+from .metrics import InstrumentedViewMixin
+from .pagination import (LimitPageNumberPagination, RankedPagination,
+                         SubscriptionPagination)
 from .permissions import AuthorOrReadOnly
+from .negotiation import FallbackContentNegotiation
+from .renderers import SHOPPING_CART_RENDERERS, FastJSONRenderer
 from .serializers import (FavoriteSerializer, IngredientSerializer,
+                          RecipeCoverageSerializer, RecipeIdsSerializer,
                           RecipeSerializer, RecipeCreateSerializer,
-                          TagSerializer, UserFollowSerializer)
+                          ShoppingListItemSerializer, TagSerializer,
+                          UserFollowSerializer)
+
+SHOPPING_CART_CHUNK_SIZE = 500
+WHAT_TO_COOK_MAX_INGREDIENTS = 100
+SIMILAR_RECIPES_LIMIT = 10
+
+
+class CatalogViewMixin:
+    """list и retrieve справочника из памяти процесса, без запросов к БД.
+
+    Поля catalog совпадают с полями сериализатора вьюсета. Ключ кэша
+    и ETag учитывают содержимое снимка: после его перечитывания из БД
+    клиенты не получат 304 на старые данные.
+    """
+    catalog = None
+
+    def get_cache_digest(self, request):
+        digest = super().get_cache_digest(request)
+        snapshot_digest = self.catalog.snapshot().digest
+        return hashlib.md5(
+            f'{digest}:{snapshot_digest}'.encode()
+        ).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(self.catalog_list, request)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(self.catalog_retrieve, request, **kwargs)
+
+    def catalog_list(self, request):
+        return Response(
+            self.filter_catalog_rows(request, self.catalog.snapshot().rows())
+        )
+
+    def catalog_retrieve(self, request, pk):
+        try:
+            row = self.catalog.snapshot().get(int(pk))
+        except ValueError:
+            row = None
+        if row is None:
+            raise Http404
+        return Response(row)
+
+    def filter_catalog_rows(self, request, rows):
+        return rows
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(InstrumentedViewMixin, CatalogViewMixin,
+                        CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'ingredients'
+    catalog = ingredient_catalog
     pagination_class = None
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -25,19 +94,163 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ['^name', ]
 
+    def filter_catalog_rows(self, request, rows):
+        # То же, что IngredientFilter и SearchFilter по '^name'.
+        prefixes = filters.SearchFilter().get_search_terms(request)
+        name = request.query_params.get('name')
+        if name:
+            prefixes.append(name)
+        if not prefixes:
+            return rows
+        prefixes = [prefix.lower() for prefix in prefixes]
+        return [
+            row for row in rows
+            if all(row['name'].lower().startswith(prefix)
+                   for prefix in prefixes)
+        ]
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='autocomplete'
+    )
+    def autocomplete(self, request):
+        query = request.query_params.get('name', '').strip()
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+            ))
+        except ValueError:
+            return Response(
+                {'errors': 'Параметр limit должен быть числом'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, settings.INGREDIENT_AUTOCOMPLETE_MAX_LIMIT))
+        ingredients = (
+            autocomplete_ingredients(query, limit) if query else []
+        )
+        response = Response(
+            self.get_serializer(ingredients, many=True).data
+        )
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.INGREDIENT_AUTOCOMPLETE_CACHE_SECONDS
+        )
+        return response
+
+
+class RecipeViewSet(InstrumentedViewMixin, CachedResponseMixin,
+                    viewsets.ModelViewSet):
+    cache_namespace = 'recipes'
+    cache_anonymous_only = True
     pagination_class = LimitPageNumberPagination
     queryset = Recipe.objects.all()
     permission_classes = [AuthorOrReadOnly, ]
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                author_is_subscribed=Value(False)
+            )
+        return queryset.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(
+                User.subscriptions.through.objects.filter(
+                    from_user=OuterRef('author'), to_user=user
+                )
+            )
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (self.action == 'download_shopping_cart'
+                and getattr(response, 'exception', False)):
+            # Ошибка выгрузки — JSON, а не файл запрошенного формата.
+            request.accepted_renderer = FastJSONRenderer()
+            request.accepted_media_type = FastJSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['image_rendition'] = (
+            'full' if self.action == 'retrieve' else 'card'
+        )
+        return context
+
+    def uncached_response(self, handler, request, *args, **kwargs):
+        """Условный GET для авторизованных пользователей.
+
+        ETag собирается из дат изменения рецептов, флагов пользователя
+        и версий тегов, ингредиентов и пользователей. При совпадении
+        If-None-Match сериализаторы не запускаются.
+        """
+        stamps = self.get_queryset().prefetch_related(None).select_related(
+            None
+        ).only('id', 'modified', 'pub_date')
+        if self.action == 'retrieve':
+            try:
+                page = list(stamps.filter(pk=kwargs[self.lookup_field]))
+            except (TypeError, ValueError):
+                page = None
+            if not page:
+                # 404 отдаст обычный обработчик.
+                return handler(request, *args, **kwargs)
+            meta = None
+        else:
+            page = self.paginate_queryset(self.filter_queryset(stamps))
+            meta = self.get_paginated_response([]).data
+        etag = self.get_etag(request, page, meta)
+        if self.is_not_modified(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif self.action == 'retrieve':
+            response = handler(request, *args, **kwargs)
+        else:
+            recipes = self.get_ranked_recipes(
+                [{'id': recipe.id} for recipe in page], 'id'
+            )
+            response = self.get_paginated_response(
+                self.get_serializer(recipes, many=True).data
+            )
+        response['ETag'] = etag
+        return response
+
+    def get_etag(self, request, recipes, meta):
+        stamp = [
+            request.get_host(),
+            self.action,
+            meta,
+            [get_version(namespace)
+             for namespace in ('tags', 'ingredients', 'users')],
+        ]
+        stamp.extend(
+            (recipe.id, recipe.modified.isoformat(), recipe.is_favorited,
+             recipe.is_in_shopping_cart, recipe.author_is_subscribed)
+            for recipe in recipes
+        )
+        return f'"{hashlib.md5(repr(stamp).encode()).hexdigest()}"'
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -98,36 +311,290 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request, pk, model, error_already, error_no
         )
 
+    def bulk_favorite_or_shopping_cart_method(self, request, model):
+        """Добавляет или удаляет сразу несколько рецептов.
+
+        Счётчики, рекомендации и списки покупок обновляются подписчиками
+        сигнала interactions_changed, как и при добавлении по одному.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        user = request.user
+        with transaction.atomic():
+            if request.method == 'POST':
+                existing = set(Recipe.objects.filter(
+                    pk__in=recipe_ids
+                ).values_list('pk', flat=True))
+                added = set(interactions.add(model, user.id, [
+                    recipe_id for recipe_id in recipe_ids
+                    if recipe_id in existing
+                ]))
+                results = {
+                    recipe_id: (
+                        'not_found' if recipe_id not in existing
+                        else 'added' if recipe_id in added
+                        else 'exists'
+                    )
+                    for recipe_id in recipe_ids
+                }
+            else:
+                removed = set(interactions.remove(model, user.id, recipe_ids))
+                results = {
+                    recipe_id: (
+                        'removed' if recipe_id in removed else 'absent'
+                    )
+                    for recipe_id in recipe_ids
+                }
+        return Response({'results': [
+            {'id': recipe_id, 'status': result}
+            for recipe_id, result in results.items()
+        ]})
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[IsAuthenticated, ],
+        url_path='favorite',
+        url_name='bulk-favorite'
+    )
+    def bulk_favorite(self, request):
+        return self.bulk_favorite_or_shopping_cart_method(
+            request, FavoriteRecipe
+        )
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[IsAuthenticated, ],
+        url_path='shopping_cart',
+        url_name='bulk-shopping-cart'
+    )
+    def bulk_shopping_cart(self, request):
+        return self.bulk_favorite_or_shopping_cart_method(
+            request, ShoppingCart
+        )
+
+    @action(
+        detail=False,
+        methods=['DELETE'],
+        permission_classes=[IsAuthenticated, ],
+        url_path='shopping_cart/clear'
+    )
+    def clear_shopping_cart(self, request):
+        interactions.remove(ShoppingCart, request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(
         detail=False,
         methods=['GET'],
         url_path='download_shopping_cart',
-        permission_classes=[IsAuthenticated, ]
+        permission_classes=[IsAuthenticated, ],
+        renderer_classes=SHOPPING_CART_RENDERERS,
+        # Как и до выбора формата, без подходящего Accept отдаём txt.
+        content_negotiation_class=FallbackContentNegotiation
     )
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_carts__user=request.user
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
         ).order_by(
             'ingredient__name'
         ).values(
             'ingredient__name',
             'ingredient__measurement_unit',
-        ).annotate(sum_amount=Sum('amount'))
-        shopping_cart = '\n'.join([
-            f'{ingredient["ingredient__name"]} - {ingredient["sum_amount"]}'
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for ingredient in ingredients
-        ])
-        response = HttpResponse(shopping_cart, content_type='text/plain')
+            sum_amount=F('total_amount')
+        )
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        if isinstance(request._request, ASGIRequest):
+            # Django 3.2 читает потоковый ответ в цикле событий, где
+            # запросы к БД запрещены: файл собирается в потоке запроса.
+            response = HttpResponse(
+                b''.join(renderer.stream(ingredients)),
+                content_type=content_type
+            )
+        else:
+            response = StreamingHttpResponse(
+                renderer.stream(
+                    ingredients.iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+                ),
+                content_type=content_type
+            )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
         return response
 
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='shopping_list',
+        permission_classes=[IsAuthenticated, ]
+    )
+    def shopping_list(self, request):
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        return Response(ShoppingListItemSerializer(items, many=True).data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='what_to_cook'
+    )
+    def what_to_cook(self, request):
+        """Рецепты по доле ингредиентов, которые уже есть.
+
+        Покрытие считается одной агрегацией по RecipeIngredient: кандидаты
+        находятся по индексу (ingredient, recipe), сериализуются только
+        рецепты текущей страницы.
+        """
+        ingredient_ids = self.get_ingredient_ids(request)
+        candidates = self.filter_queryset(
+            Recipe.objects.filter(pk__in=RecipeIngredient.objects.filter(
+                ingredient_id__in=ingredient_ids
+            ).values('recipe_id'))
+        ).order_by().values('pk')
+        scores = RecipeIngredient.objects.filter(
+            recipe_id__in=candidates
+        ).values('recipe_id').annotate(
+            ingredients_count=Count('pk'),
+            matched_count=Count(
+                'pk', filter=Q(ingredient_id__in=ingredient_ids)
+            )
+        ).annotate(
+            coverage=Cast('matched_count', FloatField())
+            / F('ingredients_count')
+        ).order_by('-coverage', '-matched_count', '-recipe_id')
+        paginator = RankedPagination()
+        page = paginator.paginate_queryset(scores, request, view=self)
+        results = self.get_ranked_recipes(page, 'recipe_id')
+        for recipe in results:
+            recipe.missing_ingredients = [
+                recipe_ingredient
+                for recipe_ingredient in recipe.recipe_ingredients.all()
+                if recipe_ingredient.ingredient_id not in ingredient_ids
+            ]
+        serializer = RecipeCoverageSerializer(
+            results,
+            many=True,
+            context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_ingredient_ids(self, request):
+        values = [
+            value
+            for param in request.query_params.getlist('ingredients')
+            for value in param.split(',')
+            if value.strip()
+        ]
+        if len(values) > WHAT_TO_COOK_MAX_INGREDIENTS:
+            raise ValidationError({
+                'ingredients': 'Не больше '
+                f'{WHAT_TO_COOK_MAX_INGREDIENTS} ингредиентов'
+            })
+        try:
+            ids = {int(value) for value in values}
+        except ValueError:
+            ids = set()
+        if not ids or min(ids) < 1:
+            raise ValidationError({
+                'ingredients': 'Передайте id ингредиентов через запятую'
+            })
+        return ids
+
+    def get_ranked_recipes(self, rows, key):
+        """Рецепты для строк с оценками в порядке строк.
+
+        Остальные значения строки становятся атрибутами рецепта.
+        """
+        recipes = self.get_queryset().in_bulk([row[key] for row in rows])
+        ranked = []
+        for row in rows:
+            recipe = recipes.get(row[key])
+            if recipe is None:
+                continue
+            for name, value in row.items():
+                if name != key:
+                    setattr(recipe, name, value)
+            ranked.append(recipe)
+        return ranked
+
+    @action(
+        detail=True,
+        methods=['GET']
+    )
+    def similar(self, request, pk):
+        """Похожие рецепты из предрассчитанной таблицы."""
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        get_object_or_404(Recipe, pk=pk)
+        limit = request.query_params.get('limit') or SIMILAR_RECIPES_LIMIT
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = None
+        if limit is None or limit < 0:
+            raise ValidationError({
+                'limit': 'Должно быть целым неотрицательным числом'
+            })
+        limit = min(limit, settings.RECOMMENDATIONS_TOP_K)
+        recipes = self.get_queryset().filter(
+            similar_to__recipe_id=pk
+        ).order_by('-similar_to__score')[:limit]
+        return Response(self.get_serializer(recipes, many=True).data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[IsAuthenticated, ]
+    )
+    def feed(self, request):
+        """Рекомендации по избранному и списку покупок пользователя.
+
+        Оценка рецепта — сумма его сходства с рецептами пользователя.
+        Пока рекомендаций нет, отдаются самые популярные рецепты.
+        """
+        favorites = FavoriteRecipe.objects.filter(
+            user=request.user
+        ).values('recipe_id')
+        shopping_carts = ShoppingCart.objects.filter(
+            user=request.user
+        ).values('recipe_id')
+        scores = SimilarRecipe.objects.filter(
+            Q(recipe_id__in=favorites) | Q(recipe_id__in=shopping_carts)
+        ).exclude(
+            similar_id__in=favorites
+        ).exclude(
+            similar_id__in=shopping_carts
+        ).values('similar_id').annotate(
+            score=Sum('score')
+        ).order_by('-score', '-similar_id')
+        paginator = RankedPagination()
+        # Источник выбирается до пагинации, чтобы номера страниц
+        # относились к тому списку, который будет отдан.
+        if scores.exists():
+            page = paginator.paginate_queryset(scores, request, view=self)
+            recipes = self.get_ranked_recipes(page, 'similar_id')
+        else:
+            recipes = paginator.paginate_queryset(
+                self.get_queryset().order_by('-favorites_count', '-id'),
+                request,
+                view=self
+            )
+        serializer = self.get_serializer(recipes, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+class UserViewSet(InstrumentedViewMixin, viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
-    pagination_class = LimitPageNumberPagination
+    serializer_class = UserFollowSerializer
+    pagination_class = SubscriptionPagination
 
     @action(
         detail=True,
@@ -153,11 +620,8 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             followed.subscriptions.add(follower)
-            serializer = UserFollowSerializer(
-                context=self.get_serializer_context()
-            )
-            return Response(serializer.to_representation(
-                instance=followed),
+            return Response(
+                self.get_serializer(followed).data,
                 status=status.HTTP_201_CREATED
             )
         if request.method == 'DELETE':
@@ -181,17 +645,68 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         url_path='subscriptions'
     )
     def subscriptions(self, request):
-        followed_list = User.objects.filter(subscriptions=request.user)
+        followed_list = User.objects.filter(
+            subscriptions=request.user
+        ).annotate(is_subscribed=Value(True))
         pages = self.paginate_queryset(followed_list)
-        serializer = UserFollowSerializer(
+        context = self.get_serializer_context()
+        context['recipes'] = self.get_recipes_previews(
+            pages, self.get_recipes_limit(request)
+        )
+        serializer = self.get_serializer(
             pages,
             many=True,
-            context=self.get_serializer_context()
+            context=context
         )
         return self.get_paginated_response(serializer.data)
 
+    def get_recipes_limit(self, request):
+        limit = request.query_params.get('recipes_limit')
+        if not limit:
+            return None
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = None
+        if limit is None or limit < 0:
+            raise ValidationError({
+                'recipes_limit': 'Должно быть целым неотрицательным числом'
+            })
+        return limit
+
+    def get_recipes_previews(self, authors, limit):
+        """Последние limit рецептов каждого автора одним запросом."""
+        recipes = Recipe.objects.filter(
+            author__in=authors
+        ).order_by('author_id', '-pub_date', '-id')
+        if limit is not None:
+            ranked = recipes.annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=[F('author_id')],
+                    order_by=[F('pub_date').desc(), F('id').desc()]
+                )
+            ).values(
+                'id', 'author_id', 'name', 'image', 'image_renditions',
+                'cooking_time', 'row_number'
+            )
+            sql, params = ranked.query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) ranked '
+                'WHERE ranked.row_number <= %s '
+                'ORDER BY ranked.author_id, ranked.row_number',
+                (*params, limit)
+            )
+        previews = {author.id: [] for author in authors}
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        return previews
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(InstrumentedViewMixin, CatalogViewMixin,
+                 CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'tags'
+    catalog = tag_catalog
     pagination_class = None
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -5,6 +5,7 @@ from .models import (Ingredient, Recipe, RecipeIngredient,
 
 
 class UserAdmin(ModelAdmin):
+    list_display = ('username', 'email', 'recipes_count', 'followers_count')
     list_filter = ('username', 'email')
 
 
@@ -21,9 +22,10 @@ class RecipeAdmin(ModelAdmin):
     empty_value_display = '-пусто-'
 
     def added_in_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     added_in_favorites.short_description = 'Популярность'
+    added_in_favorites.admin_order_field = 'favorites_count'
 
 
 class TagAdmin(ModelAdmin):
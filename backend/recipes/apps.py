@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from . import (catalog, counters, images,  # noqa: F401
+                       recommendations, search, shopping_list)
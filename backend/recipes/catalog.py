@@ -0,0 +1,146 @@
+import hashlib
+import sys
+import time
+from array import array
+from threading import Lock
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Ingredient, Tag
+from .signals import bulk_changed
+from .versions import bump_version, get_version
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок справочника в порядке сортировки модели.
+
+    id хранятся в array, остальные поля — по столбцам в кортежах,
+    позиция строки ищется по словарю id → номер. digest меняется
+    вместе с содержимым и годится для ETag.
+    """
+
+    def __init__(self, model, version, fields, rows):
+        self.model = model
+        self.version = version
+        self.fields = fields
+        self.loaded = time.monotonic()
+        self.digest = hashlib.md5(repr(rows).encode()).hexdigest()
+        self.ids = array('q', (row[0] for row in rows))
+        self.columns = tuple(
+            tuple(row[index] for row in rows)
+            for index in range(1, len(fields))
+        )
+        self.positions = {pk: index for index, pk in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, pk):
+        return pk in self.positions
+
+    def column(self, name):
+        """Значения поля name по всем строкам."""
+        if name == self.fields[0]:
+            return tuple(self.ids)
+        return self.columns[self.fields.index(name) - 1]
+
+    def values(self, index):
+        return (self.ids[index], *(column[index] for column in self.columns))
+
+    def row(self, index):
+        return dict(zip(self.fields, self.values(index)))
+
+    def rows(self):
+        return [self.row(index) for index in range(len(self.ids))]
+
+    def get(self, pk):
+        """Строка справочника словарём или None."""
+        index = self.positions.get(pk)
+        return None if index is None else self.row(index)
+
+    def instance(self, pk):
+        """Объект модели без запроса к БД или None."""
+        index = self.positions.get(pk)
+        if index is None:
+            return None
+        return self.model.from_db(
+            DEFAULT_DB_ALIAS, self.fields, self.values(index)
+        )
+
+    def memory_size(self):
+        """Примерный объём снимка в байтах."""
+        size = (sys.getsizeof(self.ids) + sys.getsizeof(self.positions)
+                + sys.getsizeof(self.columns))
+        for column in self.columns:
+            size += sys.getsizeof(column) + sum(
+                sys.getsizeof(value) for value in column
+            )
+        return size
+
+
+class Catalog:
+    """Справочник в памяти процесса.
+
+    Снимок перечитывается при смене версии и не реже чем раз в
+    CATALOG_TIMEOUT секунд. Версия лежит в кэше Django и меняется после
+    коммита изменений: с общим кэшем её видят все процессы, с LocMemCache
+    изменения из других процессов доходят только по таймауту.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self._lock = Lock()
+        self._snapshot = None
+
+    def is_fresh(self, snapshot, version):
+        return (
+            snapshot is not None and snapshot.version == version
+            and time.monotonic() - snapshot.loaded < settings.CATALOG_TIMEOUT
+        )
+
+    def load(self, version=None):
+        """Новый снимок из БД, текущий снимок процесса не меняется."""
+        return CatalogSnapshot(
+            self.model, version, self.fields,
+            list(self.model.objects.values_list(*self.fields))
+        )
+
+    @property
+    def version_key(self):
+        return f'catalog:version:{self.model._meta.model_name}'
+
+    def get_version(self):
+        return get_version(self.version_key)
+
+    def snapshot(self):
+        version = self.get_version()
+        snapshot = self._snapshot
+        if self.is_fresh(snapshot, version):
+            return snapshot
+        with self._lock:
+            if not self.is_fresh(self._snapshot, version):
+                self._snapshot = self.load(version)
+            return self._snapshot
+
+    def invalidate(self):
+        bump_version(self.version_key)
+        self._snapshot = None
+
+
+ingredient_catalog = Catalog(Ingredient, ('id', 'name', 'measurement_unit'))
+tag_catalog = Catalog(Tag, ('id', 'name', 'color', 'slug'))
+CATALOGS = {Ingredient: ingredient_catalog, Tag: tag_catalog}
+
+
+def invalidate(model):
+    transaction.on_commit(CATALOGS[model].invalidate)
+
+
+@receiver((post_save, post_delete, bulk_changed), sender=Ingredient)
+@receiver((post_save, post_delete, bulk_changed), sender=Tag)
+def catalog_changed(sender, **kwargs):
+    invalidate(sender)
@@ -0,0 +1,120 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .interactions import interactions_changed
+from .models import FavoriteRecipe, Recipe, ShoppingCart, User
+
+Subscription = User.subscriptions.through
+
+# (модель со счётчиком, поле счётчика, считаемая модель, поле связи)
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'from_user'),
+)
+
+
+def change_counter(model, pks, field, delta):
+    """Атомарно изменяет счётчик на delta у объектов с переданными pk.
+
+    Нужна и для массовых операций (bulk_create, update, delete
+    QuerySet), которые не отправляют сигналы.
+    """
+    if delta:
+        model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def recount():
+    """Пересчитывает все счётчики, возвращает число исправленных строк."""
+    fixed = {}
+    for model, field, counted_model, relation in COUNTERS:
+        drifted = model.objects.annotate(
+            actual=count_subquery(counted_model, relation)
+        ).exclude(**{field: F('actual')}).values_list('pk', flat=True)
+        pks = list(drifted)
+        if pks:
+            model.objects.filter(pk__in=pks).update(
+                **{field: count_subquery(counted_model, relation)}
+            )
+        fixed[f'{model.__name__}.{field}'] = len(pks)
+    return fixed
+
+
+@receiver(post_save, sender=Recipe)
+def increment_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        update_counters(sender, [instance.author_id], 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_counters(sender, instance, **kwargs):
+    update_counters(sender, [instance.author_id], -1)
+
+
+@receiver(interactions_changed)
+def interactions_counters(sender, recipe_ids, delta, **kwargs):
+    update_counters(sender, recipe_ids, delta)
+
+
+def update_counters(sender, pks, delta):
+    for model, field, counted_model, _ in COUNTERS:
+        if counted_model is sender:
+            change_counter(model, pks, field, delta)
+
+
+@receiver(m2m_changed, sender=Subscription)
+def update_followers_count(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action == 'pre_clear':
+        # pk_set для clear() не передаётся, запоминаем затрагиваемых.
+        if reverse:
+            instance._cleared_followed = list(
+                instance.followers.values_list('pk', flat=True)
+            )
+        return
+    if action == 'post_clear':
+        if not reverse:
+            User.objects.filter(pk=instance.pk).update(followers_count=0)
+        else:
+            change_counter(
+                User, instance._cleared_followed, 'followers_count', -1
+            )
+        return
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    if not reverse:
+        change_counter(User, [instance.pk], 'followers_count',
+                       delta * len(pk_set))
+    else:
+        change_counter(User, pk_set, 'followers_count', delta)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    # Подписки удаляемого пользователя уходят каскадом без m2m_changed.
+    change_counter(
+        User,
+        list(Subscription.objects.filter(
+            to_user=instance
+        ).values_list('from_user_id', flat=True)),
+        'followers_count',
+        -1
+    )
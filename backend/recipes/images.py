@@ -0,0 +1,107 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, features
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'thumbnail': (150, 150),
+    'card': (640, 640),
+    'full': (1280, 1280),
+}
+RENDITIONS_DIR = 'recipes/renditions'
+QUALITY = 80
+
+if features.check('webp'):
+    FORMAT, EXTENSION = 'WEBP', 'webp'
+else:
+    FORMAT, EXTENSION = 'JPEG', 'jpg'
+
+EXECUTORS = {}
+
+
+def get_executor():
+    if 'renditions' not in EXECUTORS:
+        EXECUTORS['renditions'] = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_RENDITION_WORKERS,
+            thread_name_prefix='renditions'
+        )
+    return EXECUTORS['renditions']
+
+
+def encode(image, size):
+    rendition = image.copy()
+    rendition.thumbnail(size, Image.LANCZOS)
+    if FORMAT == 'JPEG' and rendition.mode not in ('RGB', 'L'):
+        rendition = rendition.convert('RGB')
+    buffer = io.BytesIO()
+    rendition.save(buffer, FORMAT, quality=QUALITY)
+    return buffer.getvalue()
+
+
+def build_renditions(recipe_id, source):
+    """Сохраняет уменьшенные копии картинки рецепта и их имена."""
+    try:
+        with default_storage.open(source) as original:
+            image = Image.open(original)
+            image.load()
+        stem = os.path.splitext(os.path.basename(source))[0]
+        renditions = {'source': source}
+        for name, size in RENDITIONS.items():
+            renditions[name] = default_storage.save(
+                f'{RENDITIONS_DIR}/{stem}_{name}.{EXTENSION}',
+                ContentFile(encode(image, size))
+            )
+        recipe = Recipe.objects.filter(pk=recipe_id, image=source).first()
+        if recipe is None:
+            # Рецепт удалён или картинку успели заменить.
+            delete_renditions(renditions)
+            return
+        previous = recipe.image_renditions
+        recipe.image_renditions = renditions
+        recipe.save(update_fields=['image_renditions', 'modified'])
+        delete_renditions(previous)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', source)
+
+
+def build_in_worker(recipe_id, source):
+    try:
+        build_renditions(recipe_id, source)
+    finally:
+        # У потоков пула свои соединения с БД, их нужно закрывать.
+        connections.close_all()
+
+
+def delete_renditions(renditions):
+    for name, path in renditions.items():
+        if name != 'source':
+            default_storage.delete(path)
+
+
+def schedule_renditions(recipe_id, source):
+    if not settings.IMAGE_RENDITION_WORKERS:
+        build_renditions(recipe_id, source)
+        return
+    get_executor().submit(build_in_worker, recipe_id, source)
+
+
+@receiver(post_save, sender=Recipe)
+def image_changed(sender, instance, raw=False, **kwargs):
+    source = instance.image.name
+    if raw or not source or instance.image_renditions.get('source') == source:
+        return
+    transaction.on_commit(
+        lambda: schedule_renditions(instance.pk, source)
+    )
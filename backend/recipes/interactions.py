@@ -0,0 +1,113 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import FavoriteRecipe, ShoppingCart
+
+# Рецепты recipe_ids добавлены (delta=1) или убраны (delta=-1) из избранного
+# или корзины пользователя user_id; sender — FavoriteRecipe или ShoppingCart.
+# Счётчики, рекомендации и списки покупок подписываются на этот сигнал, а не
+# на post_save/post_delete, чтобы массовые операции ничего не пропускали.
+interactions_changed = Signal()
+
+# Не больше 999 параметров в запросе для SQLite.
+DELETE_CHUNK_SIZE = 500
+
+
+def insert(model, user_id, recipe_ids):
+    """Вставляет строки, возвращает recipe_id действительно вставленных.
+
+    При конфликте с параллельной вставкой строки вставляются по одной,
+    чтобы не учесть чужую строку как свою.
+    """
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([
+                model(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in recipe_ids
+            ])
+        return list(recipe_ids)
+    except IntegrityError:
+        pass
+    inserted = []
+    for recipe_id in recipe_ids:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([
+                    model(user_id=user_id, recipe_id=recipe_id)
+                ])
+        except IntegrityError:
+            continue
+        inserted.append(recipe_id)
+    return inserted
+
+
+def add(model, user_id, recipe_ids):
+    """Добавляет рецепты в избранное или корзину одним INSERT.
+
+    Возвращает добавленные recipe_id, уже добавленные пропускаются.
+    """
+    with transaction.atomic():
+        present = set(model.objects.filter(
+            user_id=user_id, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        added = insert(model, user_id, [
+            recipe_id for recipe_id in recipe_ids if recipe_id not in present
+        ])
+        if added:
+            interactions_changed.send(
+                model, user_id=user_id, recipe_ids=added, delta=1
+            )
+    return added
+
+
+def remove(model, user_id, recipe_ids=None):
+    """Убирает рецепты (по умолчанию все) одним DELETE без post_delete.
+
+    Строки сначала блокируются, поэтому параллельное удаление той же
+    строки не учитывается дважды. Возвращает убранные recipe_id.
+    """
+    queryset = model.objects.filter(user_id=user_id)
+    if recipe_ids is not None:
+        queryset = queryset.filter(recipe_id__in=recipe_ids)
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().values_list(
+            'pk', 'recipe_id'
+        ))
+        pks = [pk for pk, _ in rows]
+        with connection.cursor() as cursor:
+            for start in range(0, len(pks), DELETE_CHUNK_SIZE):
+                chunk = pks[start:start + DELETE_CHUNK_SIZE]
+                cursor.execute(
+                    'DELETE FROM {} WHERE {} IN ({})'.format(
+                        connection.ops.quote_name(model._meta.db_table),
+                        connection.ops.quote_name(model._meta.pk.column),
+                        ', '.join(['%s'] * len(chunk))
+                    ),
+                    chunk
+                )
+        removed = [recipe_id for _, recipe_id in rows]
+        if removed:
+            interactions_changed.send(
+                model, user_id=user_id, recipe_ids=removed, delta=-1
+            )
+    return removed
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def interaction_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        interactions_changed.send(
+            sender, user_id=instance.user_id,
+            recipe_ids=[instance.recipe_id], delta=1
+        )
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def interaction_deleted(sender, instance, **kwargs):
+    interactions_changed.send(
+        sender, user_id=instance.user_id,
+        recipe_ids=[instance.recipe_id], delta=-1
+    )
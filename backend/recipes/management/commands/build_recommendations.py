@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.recommendations import build_similar, get_popularity
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт похожих рецептов по совместному попаданию '
+            'в избранное и списки покупок')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать все рецепты, а не только устаревшие'
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=settings.RECOMMENDATIONS_TOP_K
+        )
+        parser.add_argument(
+            '--min-common',
+            type=int,
+            default=settings.RECOMMENDATIONS_MIN_COMMON,
+            help='Минимум общих пользователей у пары рецептов'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipes = Recipe.objects.order_by('pk')
+        if not options['all']:
+            recipes = recipes.filter(similar_stale=True)
+        recipe_ids = list(recipes.values_list('pk', flat=True))
+        popularity = get_popularity()
+        batch_size = options['batch_size']
+        created = 0
+        for start in range(0, len(recipe_ids), batch_size):
+            batch = recipe_ids[start:start + batch_size]
+            created += build_similar(
+                batch, popularity, options['top_k'], options['min_common']
+            )
+            self.stdout.write(
+                f'  {start + len(batch)}/{len(recipe_ids)} '
+                f'({time.monotonic() - started:.1f} с)'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов: {len(recipe_ids)}, похожих: {created}'
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии и для уже обработанных рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').values_list(
+            'pk', 'image', 'image_renditions'
+        )
+        built = 0
+        for pk, image, renditions in recipes.iterator():
+            if options['all'] or renditions.get('source') != image:
+                build_renditions(pk, image)
+                built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {built}'
+        ))
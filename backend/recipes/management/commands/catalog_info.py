@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.catalog import CATALOGS
+
+
+class Command(BaseCommand):
+    help = ('Размер справочников в памяти процесса: строки, версия, '
+            'занимаемая память и время загрузки')
+
+    def handle(self, *args, **options):
+        for model, catalog in CATALOGS.items():
+            # Отдельный снимок: общая версия и снимки процессов не меняются.
+            started = time.perf_counter()
+            snapshot = catalog.load(catalog.get_version())
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{model._meta.model_name}: {len(snapshot)} строк, '
+                f'версия {snapshot.version}, '
+                f'{snapshot.memory_size() / 1024:.1f} КБ, '
+                f'загрузка {elapsed * 1000:.1f} мс'
+            )
@@ -1,23 +1,157 @@
 import csv
+import io
+import json
+import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from recipes.models import Ingredient
+from recipes.signals import bulk_changed
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)
+    ))),
+    'data'
+)
+DEFAULT_PATH = os.path.join(DATA_DIR, 'ingredients.csv')
+DEFAULT_BATCH_SIZE = 1000
+CSV_HEADER = ['name', 'measurement_unit']
+
+
+def read_csv(path):
+    with open(path, 'r', encoding='UTF-8') as csv_file:
+        for row in csv.reader(csv_file, delimiter=','):
+            if row and row != CSV_HEADER:
+                yield row[0], row[1]
+
+
+def read_json(path):
+    with open(path, 'r', encoding='UTF-8') as json_file:
+        for item in json.load(json_file):
+            yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 class Command(BaseCommand):
-    help = 'Наполнение БД из файлов CSV'
+    help = 'Наполнение БД ингредиентами из файлов CSV или JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=[DEFAULT_PATH],
+            help='Пути к файлам .csv или .json'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество строк в одной пачке вставки'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать новые ингредиенты, ничего не записывая'
+        )
 
     def handle(self, *args, **options):
-        with open(
-                '../backend/recipes/data/ingredients.csv',
-                'r',
-                encoding='UTF-8'
-        ) as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            next(csv_reader)
-            for row in csv_reader:
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1],
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        started = time.monotonic()
+        existing = set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+        self.stdout.write(
+            f'В базе уже {len(existing)} ингредиентов '
+            f'({time.monotonic() - started:.2f} с)'
+        )
+        for path in options['paths']:
+            self.import_file(path, existing, options)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.2f} с'
+        ))
+
+    def import_file(self, path, existing, options):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in READERS:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
+        if not os.path.isfile(path):
+            raise CommandError(f'Файл не найден: {path}')
+        started = time.monotonic()
+        new_rows = []
+        for row in READERS[extension](path):
+            if row not in existing:
+                existing.add(row)
+                new_rows.append(row)
+        self.stdout.write(
+            f'{path}: новых ингредиентов {len(new_rows)}'
+        )
+        if options['dry_run'] or not new_rows:
+            return
+        insert = (
+            self.copy_batch if connection.vendor == 'postgresql'
+            else self.bulk_create_batch
+        )
+        inserted = 0
+        with transaction.atomic():
+            for batch in batches(new_rows, options['batch_size']):
+                insert(batch)
+                inserted += len(batch)
+                self.stdout.write(
+                    f'  {inserted}/{len(new_rows)} '
+                    f'({time.monotonic() - started:.2f} с)'
                 )
+            # Массовая вставка не отправляет post_save: сбрасываем
+            # справочник и закэшированные ответы API явно.
+            bulk_changed.send(Ingredient)
+
+    def bulk_create_batch(self, batch):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ],
+            ignore_conflicts=True
+        )
+
+    def copy_batch(self, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredient_import '
+                '(name text, measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.execute('TRUNCATE ingredient_import')
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT DO NOTHING'
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.shopping_list import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт сводных списков покупок по корзинам пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='users',
+            help='Пересчитать только этого пользователя (можно несколько)'
+        )
+
+    def handle(self, *args, **options):
+        fixed = rebuild(options['users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны, исправлено строк: {fixed}'
+        ))
@@ -0,0 +1,192 @@
+import io
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes.counters import recount
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag, User)
+from recipes.search import refresh_search
+from recipes.shopping_list import rebuild
+from recipes.signals import bulk_changed
+
+IMAGE_NAME = 'recipes/bench.png'
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F5C000', '#2D9CDB')
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=5)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Зерно генератора случайных чисел для воспроизводимости'
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.started = time.monotonic()
+        if not Ingredient.objects.exists():
+            call_command('import_data', stdout=self.stdout)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = self.create_tags(options['tags'])
+        image = self.create_image()
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'])
+            recipe_ids = self.create_recipes(
+                options['recipes'], user_ids, image
+            )
+            self.create_links(
+                'ингредиенты', RecipeIngredient, recipe_ids,
+                ingredient_ids, options['ingredients_per_recipe'],
+                lambda recipe, ingredient: RecipeIngredient(
+                    recipe_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=self.random.randint(1, 500)
+                )
+            )
+            self.create_links(
+                'теги', Recipe.tags.through, recipe_ids, tag_ids,
+                options['tags_per_recipe'],
+                lambda recipe, tag: Recipe.tags.through(
+                    recipe_id=recipe, tag_id=tag
+                )
+            )
+            self.create_links(
+                'избранное', FavoriteRecipe, user_ids, recipe_ids,
+                options['favorites_per_user'],
+                lambda user, recipe: FavoriteRecipe(
+                    user_id=user, recipe_id=recipe
+                )
+            )
+            self.create_links(
+                'списки покупок', ShoppingCart, user_ids, recipe_ids,
+                options['carts_per_user'],
+                lambda user, recipe: ShoppingCart(
+                    user_id=user, recipe_id=recipe
+                )
+            )
+            self.create_links(
+                'подписки', User.subscriptions.through, user_ids, user_ids,
+                options['follows_per_user'],
+                lambda follower, followed: User.subscriptions.through(
+                    from_user_id=followed, to_user_id=follower
+                )
+            )
+            # bulk_create не отправляет сигналы, поэтому счётчики,
+            # поисковые данные и списки покупок пересчитываем целиком.
+            recount()
+            refresh_search()
+            rebuild()
+            for model in (User, Recipe, RecipeIngredient, Recipe.tags.through,
+                          FavoriteRecipe, ShoppingCart,
+                          User.subscriptions.through):
+                bulk_changed.send(model)
+        self.log('Готово')
+
+    def log(self, message):
+        self.stdout.write(
+            f'{message} ({time.monotonic() - self.started:.1f} с)'
+        )
+
+    def create_tags(self, count):
+        for index in range(count):
+            Tag.objects.get_or_create(
+                slug=f'bench-{index}',
+                defaults={
+                    'name': f'Тег {index}',
+                    'color': TAG_COLORS[index % len(TAG_COLORS)],
+                }
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_image(self):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return IMAGE_NAME
+
+    def new_ids(self, model, last_id):
+        return list(
+            model.objects.filter(pk__gt=last_id or 0).order_by(
+                'pk'
+            ).values_list('pk', flat=True)
+        )
+
+    def create_users(self, count):
+        last_id = User.objects.aggregate(last=Max('pk'))['last']
+        offset = (last_id or 0) + 1
+        password = make_password('bench-password')
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'bench_{offset + index}',
+                    email=f'bench_{offset + index}@example.com',
+                    first_name='Бенч',
+                    last_name=f'Пользователь {offset + index}',
+                    password=password,
+                )
+                for index in range(count)
+            ),
+            batch_size=self.batch_size
+        )
+        self.log(f'Пользователей: {count}')
+        return self.new_ids(User, last_id)
+
+    def create_recipes(self, count, user_ids, image):
+        last_id = Recipe.objects.aggregate(last=Max('pk'))['last']
+        for batch in chunks(range(count), self.batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=self.random.choice(user_ids),
+                    name=f'Рецепт {index}',
+                    text='Описание процесса приготовления. ' * 20,
+                    image=image,
+                    cooking_time=self.random.randint(1, 180),
+                )
+                for index in batch
+            )
+        self.log(f'Рецептов: {count}')
+        return self.new_ids(Recipe, last_id)
+
+    def create_links(self, title, model, sources, targets, per_source,
+                     build):
+        per_source = min(per_source, len(targets))
+        created = 0
+        batch = []
+        for source in sources:
+            for target in self.random.sample(targets, per_source):
+                batch.append(build(source, target))
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                created += len(batch)
+                batch = []
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+        self.log(f'Связей «{title}»: {created}')
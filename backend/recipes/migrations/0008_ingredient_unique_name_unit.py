@@ -0,0 +1,58 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Максимум PositiveSmallIntegerField в PostgreSQL.
+MAX_AMOUNT = 32767
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Оставляет по одному ингредиенту с одинаковыми названием и единицей.
+
+    Рецепты переходят на оставленный ингредиент; если в рецепте были оба,
+    количества складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = Ingredient.objects.order_by().values(
+        'name', 'measurement_unit'
+    ).annotate(kept_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for duplicate in duplicates:
+        kept_id = duplicate['kept_id']
+        removed_ids = list(Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(pk=kept_id).values_list('pk', flat=True))
+        items = RecipeIngredient.objects.filter(
+            ingredient_id__in=removed_ids
+        ).order_by('pk')
+        for item in items:
+            kept = RecipeIngredient.objects.filter(
+                recipe_id=item.recipe_id, ingredient_id=kept_id
+            ).first()
+            if kept is None:
+                item.ingredient_id = kept_id
+                item.save(update_fields=['ingredient'])
+                continue
+            kept.amount = min(kept.amount + item.amount, MAX_AMOUNT)
+            kept.save(update_fields=['amount'])
+            item.delete()
+        Ingredient.objects.filter(pk__in=removed_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_auto_20220918_0349'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+INDEXES = (
+    (
+        'recipes_ingredient_name_prefix_idx',
+        'ON recipes_ingredient (UPPER(name) text_pattern_ops)'
+    ),
+    (
+        'recipes_ingredient_name_trgm_idx',
+        'ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops)'
+    ),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, definition in INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} {definition}')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -38,6 +38,16 @@ class User(AbstractUser, UserValidator):
         max_length=150,
         verbose_name='Пароль'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
     USERNAME_FIELD: 'email'
 
     class Meta:
@@ -63,6 +73,12 @@ class Ingredient(models.Model):
         ordering = ['-id']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -103,12 +119,17 @@ class Recipe(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
+        db_index=False,
         verbose_name='Автор рецепта'
     )
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата добавления'
     )
+    modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
     name = models.CharField(
         max_length=200,
         verbose_name='Название рецепта',
@@ -123,6 +144,11 @@ class Recipe(models.Model):
         verbose_name='Картинка',
         help_text='Загрузите фото готового блюда'
     )
+    image_renditions = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки'
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         through='RecipeIngredient',
@@ -139,9 +165,39 @@ class Recipe(models.Model):
         verbose_name='Время приготовления',
         help_text='Время приготовления в минутах'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    similar_stale = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='Похожие рецепты устарели'
+    )
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-favorites_count'],
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            # Заменяет индекс внешнего ключа author.
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -190,6 +246,7 @@ class FavoriteRecipe(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='favorites',
+        db_index=False,
         verbose_name='Пользователь',
     )
     recipe = models.ForeignKey(
@@ -207,6 +264,15 @@ class FavoriteRecipe(models.Model):
                 name='unique_favorite'
             )
         ]
+        # Избранное ищется от пользователя: его страница и флаг
+        # is_favorited в списке рецептов. Индекс (user, recipe)
+        # заменяет индекс внешнего ключа user.
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='favorite_user_recipe_idx'
+            ),
+        ]
         verbose_name = 'Избранный'
         verbose_name_plural = 'Избранное'
 
@@ -219,6 +285,7 @@ class ShoppingCart(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='shopping_carts',
+        db_index=False,
         verbose_name='Пользователь',
     )
     recipe = models.ForeignKey(
@@ -236,8 +303,88 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+        # Как у FavoriteRecipe: для выгрузки и is_in_shopping_cart.
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='shopping_cart_user_recipe_idx'
+            ),
+        ]
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзины покупок'
 
     def __str__(self):
         return f'В корзине покупок {self.user.username}: {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок пользователя.
+
+    Поддерживается модулем recipes.shopping_list.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        db_index=False,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        ordering = ['user', 'ingredient']
+        # Ограничение служит и индексом для чтения списка пользователя.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Списки покупок'
+
+    def __str__(self):
+        return f'{self.user.username}: {self.ingredient} {self.total_amount}'
+
+
+class SimilarRecipe(models.Model):
+    """Предрассчитанный сосед рецепта по избранному и спискам покупок."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        ordering = ['recipe', '-score']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            ),
+        ]
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+    def __str__(self):
+        return f'{self.recipe} → {self.similar}'
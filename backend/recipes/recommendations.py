@@ -0,0 +1,103 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.dispatch import receiver
+
+from .interactions import interactions_changed
+from .models import FavoriteRecipe, Recipe, ShoppingCart, SimilarRecipe
+
+# Избранное и список покупок — неявные оценки, UNION ALL позволяет
+# PostgreSQL пробрасывать условие по user_id в индексы обеих таблиц.
+INTERACTIONS_SQL = (
+    'SELECT user_id, recipe_id FROM recipes_favoriterecipe '
+    'UNION ALL '
+    'SELECT user_id, recipe_id FROM recipes_shoppingcart'
+)
+POPULARITY_SQL = (
+    f'SELECT recipe_id, COUNT(*) FROM ({INTERACTIONS_SQL}) interactions '
+    'GROUP BY recipe_id'
+)
+COOCCURRENCE_SQL = """
+    SELECT source.recipe_id, target.recipe_id, COUNT(*)
+    FROM (
+        SELECT user_id, recipe_id FROM recipes_favoriterecipe
+        WHERE recipe_id IN ({placeholders})
+        UNION ALL
+        SELECT user_id, recipe_id FROM recipes_shoppingcart
+        WHERE recipe_id IN ({placeholders})
+    ) source
+    JOIN ({interactions}) target
+        ON target.user_id = source.user_id
+        AND target.recipe_id <> source.recipe_id
+    GROUP BY source.recipe_id, target.recipe_id
+    HAVING COUNT(*) >= %s
+"""
+
+
+def get_popularity():
+    with connection.cursor() as cursor:
+        cursor.execute(POPULARITY_SQL)
+        return dict(cursor.fetchall())
+
+
+def get_cooccurrences(recipe_ids, min_common):
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            COOCCURRENCE_SQL.format(
+                placeholders=placeholders,
+                interactions=INTERACTIONS_SQL
+            ),
+            [*recipe_ids, *recipe_ids, min_common]
+        )
+        yield from cursor.fetchall()
+
+
+def build_similar(recipe_ids, popularity, top_k, min_common=1):
+    """Пересчитывает top_k похожих для пачки рецептов.
+
+    Сходство — число общих пользователей, нормированное на
+    популярность обоих рецептов: common / sqrt(n_a * n_b).
+    """
+    neighbours = defaultdict(list)
+    for source, target, common in get_cooccurrences(recipe_ids, min_common):
+        neighbours[source].append((
+            common / math.sqrt(popularity[source] * popularity[target]),
+            target
+        ))
+    similar = [
+        SimilarRecipe(recipe_id=source, similar_id=target, score=score)
+        for source, candidates in neighbours.items()
+        for score, target in heapq.nlargest(top_k, candidates)
+    ]
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+        SimilarRecipe.objects.bulk_create(similar)
+        Recipe.objects.filter(pk__in=recipe_ids).update(similar_stale=False)
+    return len(similar)
+
+
+def mark_stale(user_id, recipe_ids):
+    """Помечает рецепты, чьё соседство изменилось, для пересчёта.
+
+    Новая оценка пользователя меняет сходство рецепта со всеми
+    остальными рецептами этого пользователя.
+    """
+    Recipe.objects.filter(
+        Q(pk__in=recipe_ids)
+        | Q(pk__in=FavoriteRecipe.objects.filter(
+            user_id=user_id
+        ).values('recipe_id'))
+        | Q(pk__in=ShoppingCart.objects.filter(
+            user_id=user_id
+        ).values('recipe_id')),
+        similar_stale=False
+    ).update(similar_stale=True)
+
+
+@receiver(interactions_changed)
+def interaction_changed(sender, user_id, recipe_ids, **kwargs):
+    mark_stale(user_id, recipe_ids)
@@ -0,0 +1,251 @@
+import bisect
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock, local
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Ingredient, Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+# Веса полей как у setweight A, B и C в PostgreSQL.
+WEIGHTS = {'name': 1.0, 'ingredients': 0.4, 'text': 0.2}
+# Сколько лучших совпадений отдаёт индекс в памяти.
+FALLBACK_LIMIT = 500
+TOKEN = re.compile(r'\w+')
+
+UPDATE_VECTOR_SQL = f"""
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', recipes_recipe.name), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_recipeingredient recipe_ingredient
+            JOIN recipes_ingredient ingredient
+                ON ingredient.id = recipe_ingredient.ingredient_id
+            WHERE recipe_ingredient.recipe_id = recipes_recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', recipes_recipe.text), 'C')
+"""
+MATCH_SQL = (
+    'SELECT id FROM recipes_recipe WHERE search_vector '
+    f"@@ plainto_tsquery('{SEARCH_CONFIG}', %s)"
+)
+RANK_SQL = (
+    'ts_rank(recipes_recipe.search_vector, '
+    f"plainto_tsquery('{SEARCH_CONFIG}', %s))"
+)
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower().replace('ё', 'е'))
+
+
+class RecipeSearchIndex:
+    """Инвертированный индекс рецептов в памяти процесса.
+
+    Заменяет tsvector и GIN-индекс там, где их нет (SQLite). Слова
+    запроса ищутся по префиксу, рецепт должен содержать все слова.
+    Изменения из других процессов сигналы сюда не доносят, поэтому
+    индекс перечитывается не реже чем раз в SEARCH_INDEX_TIMEOUT секунд.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._postings = None
+        self._terms = None
+        self._documents = None
+        self._loaded = None
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+
+    def _documents_from_db(self, ids=None):
+        recipes = Recipe.objects.order_by()
+        links = RecipeIngredient.objects.order_by()
+        if ids is not None:
+            recipes = recipes.filter(pk__in=ids)
+            links = links.filter(recipe_id__in=ids)
+        ingredients = defaultdict(list)
+        for recipe_id, name in links.values_list(
+                'recipe_id', 'ingredient__name'):
+            ingredients[recipe_id].append(name)
+        for recipe_id, name, text in recipes.values_list('id', 'name', 'text'):
+            weights = {}
+            for field, value in (
+                    ('text', text),
+                    ('ingredients', ' '.join(ingredients[recipe_id])),
+                    ('name', name)):
+                for term in tokenize(value):
+                    weights[term] = max(weights.get(term, 0), WEIGHTS[field])
+            yield recipe_id, weights
+
+    def _add(self, recipe_id, weights):
+        for term, weight in weights.items():
+            if term not in self._postings:
+                bisect.insort(self._terms, term)
+            self._postings[term][recipe_id] = weight
+        self._documents[recipe_id] = set(weights)
+
+    def _remove(self, recipe_id):
+        for term in self._documents.pop(recipe_id, ()):
+            self._postings[term].pop(recipe_id, None)
+
+    def _load(self):
+        if (self._postings is not None and time.monotonic() - self._loaded
+                < settings.SEARCH_INDEX_TIMEOUT):
+            return
+        self._postings = defaultdict(dict)
+        self._terms = []
+        self._documents = {}
+        for recipe_id, weights in self._documents_from_db():
+            self._add(recipe_id, weights)
+        self._loaded = time.monotonic()
+
+    def refresh(self, ids):
+        with self._lock:
+            if self._postings is None:
+                return
+            ids = set(ids)
+            for recipe_id in ids:
+                self._remove(recipe_id)
+            for recipe_id, weights in self._documents_from_db(ids):
+                self._add(recipe_id, weights)
+
+    def remove(self, ids):
+        with self._lock:
+            if self._postings is not None:
+                for recipe_id in ids:
+                    self._remove(recipe_id)
+
+    def _match(self, query_term):
+        matches = {}
+        position = bisect.bisect_left(self._terms, query_term)
+        while (position < len(self._terms)
+               and self._terms[position].startswith(query_term)):
+            for recipe_id, weight in self._postings.get(
+                    self._terms[position], {}).items():
+                matches[recipe_id] = max(matches.get(recipe_id, 0), weight)
+            position += 1
+        return matches
+
+    def search(self, query, limit=FALLBACK_LIMIT):
+        """Словарь id рецепта → релевантность для лучших совпадений."""
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        with self._lock:
+            self._load()
+            scores = None
+            for term in terms:
+                matches = self._match(term)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {
+                        recipe_id: score + matches[recipe_id]
+                        for recipe_id, score in scores.items()
+                        if recipe_id in matches
+                    }
+        best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return dict(best)
+
+
+search_index = RecipeSearchIndex()
+_deferred = local()
+
+
+@contextmanager
+def defer_ingredient_refresh(recipe_id):
+    """Строки RecipeIngredient рецепта не пересчитывают поиск по одной.
+
+    Для блока, после которого рецепт сохраняется и пересчитывается целиком.
+    """
+    recipe_ids = getattr(_deferred, 'recipe_ids', set())
+    _deferred.recipe_ids = recipe_ids | {recipe_id}
+    try:
+        yield
+    finally:
+        _deferred.recipe_ids = recipe_ids
+
+
+def refresh_search(ids=None):
+    """Пересчитывает поисковые данные рецептов ids (None — всех).
+
+    Вызывается сигналами, а после массовых операций с ингредиентами
+    рецепта, которые сигналы не отправляют, — явно.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            if ids is None:
+                cursor.execute(UPDATE_VECTOR_SQL)
+            else:
+                cursor.execute(
+                    UPDATE_VECTOR_SQL + ' WHERE recipes_recipe.id = ANY(%s)',
+                    [list(ids)]
+                )
+        return
+    if ids is None:
+        transaction.on_commit(search_index.invalidate)
+    else:
+        ids = list(ids)
+        transaction.on_commit(lambda: search_index.refresh(ids))
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, по убыванию релевантности."""
+    if connection.vendor == 'postgresql':
+        queryset = queryset.filter(
+            pk__in=RawSQL(MATCH_SQL, [query])
+        ).annotate(
+            search_rank=RawSQL(RANK_SQL, [query], output_field=FloatField())
+        )
+    else:
+        scores = search_index.search(query)
+        if not scores:
+            return queryset.none()
+        queryset = queryset.filter(pk__in=scores).annotate(
+            search_rank=Case(
+                *(When(pk=pk, then=Value(score))
+                  for pk, score in scores.items()),
+                output_field=FloatField()
+            )
+        )
+    return queryset.order_by('-search_rank', '-pub_date', '-id')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None
+               and not {'name', 'text'} & set(update_fields)):
+        return
+    refresh_search([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    if connection.vendor != 'postgresql':
+        transaction.on_commit(lambda: search_index.remove([instance.pk]))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, raw=False, **kwargs):
+    if raw or instance.recipe_id in getattr(_deferred, 'recipe_ids', ()):
+        return
+    refresh_search([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    refresh_search(
+        instance.recipe_ingredients.values_list('recipe_id', flat=True)
+    )
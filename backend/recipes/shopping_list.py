@@ -0,0 +1,170 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .interactions import interactions_changed
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+def get_recipe_amounts(recipe_ids):
+    """Суммы ингредиентов рецептов: {ingredient_id: amount}."""
+    return dict(
+        RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total')
+    )
+
+
+def apply_deltas(user_ids, deltas):
+    """Прибавляет deltas {ingredient_id: количество} к спискам покупок.
+
+    Строки с нулевой суммой удаляются. Нужна и для массовых операций
+    (bulk_create, bulk_update, delete QuerySet), которые не отправляют
+    сигналы.
+    """
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    with transaction.atomic():
+        existing = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.select_for_update().filter(
+                user_id__in=user_ids, ingredient_id__in=deltas
+            )
+        }
+        to_create = []
+        to_update = []
+        to_delete = []
+        for user_id in user_ids:
+            for ingredient_id, delta in deltas.items():
+                item = existing.get((user_id, ingredient_id))
+                if item is None:
+                    if delta > 0:
+                        to_create.append(ShoppingListItem(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            total_amount=delta
+                        ))
+                    continue
+                item.total_amount += delta
+                if item.total_amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+        if to_delete:
+            ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            ShoppingListItem.objects.bulk_update(to_update, ['total_amount'])
+        if to_create:
+            ShoppingListItem.objects.bulk_create(to_create)
+
+
+def change_cart(user_id, recipe_ids, sign):
+    """Учитывает добавление (sign=1) или удаление (sign=-1) рецептов."""
+    if recipe_ids:
+        apply_deltas([user_id], {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in get_recipe_amounts(
+                recipe_ids
+            ).items()
+        })
+
+
+def change_recipe(recipe_id, deltas):
+    """Учитывает изменение ингредиентов рецепта в списках покупок."""
+    if any(deltas.values()):
+        apply_deltas(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('user_id', flat=True),
+            deltas
+        )
+
+
+def rebuild(user_ids=None):
+    """Пересчитывает списки покупок, возвращает число исправленных строк."""
+    carts = RecipeIngredient.objects.order_by()
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(recipe__shopping_carts__user_id__in=user_ids)
+        items = items.filter(user_id__in=user_ids)
+    else:
+        carts = carts.filter(recipe__shopping_carts__isnull=False)
+    expected = {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in carts.values(
+            'recipe__shopping_carts__user_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).values_list(
+            'recipe__shopping_carts__user_id', 'ingredient_id', 'total'
+        )
+    }
+    to_update = []
+    to_delete = []
+    with transaction.atomic():
+        for item in items.select_for_update():
+            total = expected.pop((item.user_id, item.ingredient_id), None)
+            if total is None:
+                to_delete.append(item.pk)
+            elif total != item.total_amount:
+                item.total_amount = total
+                to_update.append(item)
+        if to_delete:
+            ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+        ShoppingListItem.objects.bulk_update(
+            to_update, ['total_amount'], batch_size=1000
+        )
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=total
+                )
+                for (user_id, ingredient_id), total in expected.items()
+            ],
+            batch_size=1000
+        )
+    return len(to_update) + len(to_delete) + len(expected)
+
+
+@receiver(interactions_changed, sender=ShoppingCart)
+def cart_changed(sender, user_id, recipe_ids, delta, **kwargs):
+    change_cart(user_id, recipe_ids, delta)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, raw=False, **kwargs):
+    # Для изменённой строки нужны прежние ингредиент и количество.
+    instance._previous = None
+    if instance.pk and not raw:
+        instance._previous = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = defaultdict(int)
+    deltas[instance.ingredient_id] += instance.amount
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        deltas[previous[0]] -= previous[1]
+    change_recipe(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    change_recipe(
+        instance.recipe_id, {instance.ingredient_id: -instance.amount}
+    )
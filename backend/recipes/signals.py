@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Массовое изменение модели sender (bulk_create, COPY, update), для которого
+# Django не отправляет post_save и post_delete. Отправлять внутри той же
+# транзакции: подписчики сами откладывают работу до коммита.
+bulk_changed = Signal()
@@ -0,0 +1,26 @@
+import time
+
+from django.core.cache import cache
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    """Версия по ключу кэша: время последнего изменения в мс.
+
+    Если ключ вытеснен из кэша, появляется новая версия, а не прежняя,
+    поэтому данные под старой версией уже не читаются.
+    """
+    version = cache.get(key)
+    if version is not None:
+        return version
+    cache.add(key, now_ms(), None)
+    return cache.get(key)
+
+
+def bump_version(key):
+    # Версия только растёт, даже если часы процессов расходятся.
+    current = cache.get(key) or 0
+    cache.set(key, max(now_ms(), current + 1), None)
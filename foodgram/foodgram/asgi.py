@@ -0,0 +1,39 @@
+import asyncio
+import os
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+
+class ThreadPerRequestApplication:
+    """Выполняет синхронный код каждого запроса в отдельном потоке.
+
+    Django 3.2 запускает все синхронные представления в одном общем
+    потоке, и медленный запрос задерживает остальные. Контекст
+    ThreadSensitiveContext даёт запросу свой поток (так делает
+    Django 4.0), а семафор ограничивает число одновременных потоков
+    и соединений с БД.
+    """
+
+    def __init__(self, application, max_threads):
+        self.application = application
+        self.max_threads = max_threads
+        self.semaphore = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.application(scope, receive, send)
+            return
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_threads)
+        async with self.semaphore:
+            async with ThreadSensitiveContext():
+                await self.application(scope, receive, send)
+
+
+application = ThreadPerRequestApplication(
+    get_asgi_application(), settings.ASGI_MAX_THREADS
+)
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,6 +67,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Сколько запросов ASGI-сервер обрабатывает одновременно в потоках.
+ASGI_MAX_THREADS = int(os.getenv('ASGI_MAX_THREADS', default=32))
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
@@ -77,6 +81,24 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+API_CACHE_TIMEOUT = 60 * 5
+
+# Как часто справочники в памяти процесса перечитываются из БД, даже если
+# версия в кэше не менялась (изменения из других процессов с LocMemCache).
+CATALOG_TIMEOUT = int(os.getenv('CATALOG_TIMEOUT', default=60))
+# То же для поискового индекса в памяти, когда нет PostgreSQL.
+SEARCH_INDEX_TIMEOUT = int(os.getenv('SEARCH_INDEX_TIMEOUT', default=60))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -112,13 +134,59 @@ STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+INGREDIENT_AUTOCOMPLETE_LIMIT = 10
+
+INGREDIENT_AUTOCOMPLETE_MAX_LIMIT = 50
+
+INGREDIENT_AUTOCOMPLETE_CACHE_SECONDS = 60 * 60
+
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', default=2))
+
+RECOMMENDATIONS_TOP_K = 20
+
+RECOMMENDATIONS_MIN_COMMON = 1
+
+QUERY_BUDGETS = {
+    'RecipeViewSet.list': 6,
+    'RecipeViewSet.retrieve': 5,
+    'RecipeViewSet.what_to_cook': 7,
+    'RecipeViewSet.similar': 5,
+    'RecipeViewSet.feed': 6,
+    'RecipeViewSet.download_shopping_cart': 2,
+    'RecipeViewSet.shopping_list': 2,
+    'UserViewSet.subscriptions': 4,
+    'IngredientViewSet.list': 2,
+    'IngredientViewSet.autocomplete': 2,
+    'TagViewSet.list': 2,
+}
+
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', default='') == 'True'
+
+# Заголовок Server-Timing с числом и временем SQL-запросов раскрывает
+# внутренности сервера, поэтому по умолчанию только в DEBUG.
+SERVER_TIMING = DEBUG or os.getenv('SERVER_TIMING', default='') == 'True'
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -128,6 +196,13 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+# Кэш токенов авторизации: размер и время жизни записи в секундах.
+# TOKEN_CACHE_SHARED добавляет общий для процессов кэш из CACHES, через
+# него отзыв токена сразу виден всем процессам.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=60))
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', default='') == 'True'
+
 DJOSER = {
     'HIDE_USERS': False,
     'LOGIN_FIELD': 'email',